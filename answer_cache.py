@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+from config import Config
+
+
+# Function to normalize a question so casing, spacing and trailing punctuation do not matter
+def normalize_question(question):
+    question = re.sub(r"\s+", " ", question).strip().lower()
+    return question.rstrip("?!. ")
+
+
+# Function to hash any JSON-serializable value
+def _digest(value):
+    raw = json.dumps(value, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    Persistent cache of chat answers.
+
+    With temperature 0 an answer is a function of the model, the system
+    prompt, the history actually sent and the question, so all four go into
+    the key. Editing the prompt or switching model changes the key and old
+    entries are simply never read again; they expire after the TTL.
+    """
+
+    def __init__(self, path=None, ttl=None):
+        self.path = path or Config.answer_cache_path
+        self.ttl = ttl if ttl is not None else Config.answer_cache_ttl
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, answer TEXT NOT NULL, created REAL NOT NULL)"
+            )
+
+    # Function to open a connection, one per call so any thread can use the cache
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    # Function to build the cache key from the exact message list sent to the model
+    @staticmethod
+    def make_key(model, messages):
+        """
+        Args:
+            model (str): Chat model name
+            messages (list): System prompt, trimmed history and the question
+
+        Returns:
+            str: Hex digest identifying the request
+        """
+        system_prompt = messages[0]["content"]
+        history = messages[1:-1]
+        question = normalize_question(messages[-1]["content"])
+        return _digest([model, _digest(system_prompt), _digest(history), question])
+
+    # Function to read a cached answer, returns None when missing or expired
+    def get(self, key):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT answer, created FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        answer, created = row
+        if self.ttl and time.time() - created > self.ttl:
+            return None
+        return answer
+
+    # Function to store an answer and drop expired entries
+    def put(self, key, answer):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, created) VALUES (?, ?, ?)",
+                (key, answer, now),
+            )
+            if self.ttl:
+                conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
@@ -0,0 +1,418 @@
+"""
+Headless HTTP/WebSocket API for the voice consultant, for kiosk and IVR
+clients. Runs the same pipeline, prompt and Config as the Streamlit app.
+
+    python api_server.py [--port 8000]
+
+    POST /api/ask     {"question": ..., "session_id": ...}  -> {"answer": ..., "session_id": ...}
+    POST /api/speak   JSON question, or a raw audio/* recording -> spoken answer, streamed
+    WS   /ws          binary recording or {"type": "question", "text": ...} in;
+                      session, transcript, token, error, done and cancelled JSON messages plus
+                      binary audio chunks out
+    GET  /health, /metrics
+
+The session id is taken from the JSON body, the X-Session-Id header or the
+session_id query argument; a new one is returned when none is given.
+"""
+import asyncio
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+import tornado.escape
+import tornado.iostream
+import tornado.web
+import tornado.websocket
+import cancellation
+import metrics
+from assistant import answer_with_speech, get_answer, transcribe_recording
+from history import ConversationMemory
+from session_store import get_session_store
+from media_server import AUDIO_MIME_TYPES
+from config import Config
+
+# The OpenAI calls are blocking, they run on this bounded pool while the
+# event loop serves every connection
+_executor = ThreadPoolExecutor(max_workers=Config.api_workers, thread_name_prefix="api")
+
+_DONE = object()
+
+
+class Session:
+    """Conversation state of one API client, turns are answered one at a time."""
+
+    def __init__(self, session_id, state=None):
+        self.session_id = session_id
+        self.history = state.history if state else []
+        self.memory = ConversationMemory(
+            summary=state.summary if state else "",
+            summarized=state.summarized if state else 0,
+        )
+        self.memory.trim(self.history)
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class SessionRegistry:
+    """
+    Sessions in use by this process, dropped after Config.api_session_ttl
+    seconds idle. With a session store they are loaded from and saved to it,
+    so a conversation can continue on any worker or after a restart.
+    """
+
+    def __init__(self, ttl=None, store=None):
+        self.ttl = ttl or Config.api_session_ttl
+        self.store = store if store is not None else get_session_store()
+        self.sessions = {}
+
+    # Function to get a session by id, loading or creating it when not in use here
+    async def get(self, session_id=None):
+        self.expire()
+        session_id = session_id or uuid.uuid4().hex
+        session = self.sessions.get(session_id)
+        if session is None:
+            state = None
+            if self.store is not None:
+                state = await asyncio.get_running_loop().run_in_executor(_executor, self.store.load, session_id)
+            # Another request may have loaded it meanwhile
+            session = self.sessions.setdefault(session_id, Session(session_id, state))
+        session.last_used = time.monotonic()
+        return session
+
+    def expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for session_id in [s.session_id for s in self.sessions.values() if s.last_used < cutoff]:
+            if not self.sessions[session_id].lock.locked():
+                del self.sessions[session_id]
+
+
+# Function to run a blocking call on the pool with the turn's trace as the current trace
+def run_traced(trace, function, *args):
+    def call():
+        metrics.set_current_trace(trace)
+        try:
+            return function(*args)
+        finally:
+            metrics.set_current_trace(None)
+    return asyncio.get_running_loop().run_in_executor(_executor, call)
+
+
+# Function to iterate a blocking generator from the event loop, one item per pool call
+async def iterate_traced(trace, generator):
+    try:
+        while True:
+            item = await run_traced(trace, next, generator, _DONE)
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        # Closing runs the generator's cleanup, e.g. releasing the chat stream
+        await run_traced(trace, generator.close)
+
+
+class Turn:
+    """
+    One question/answer exchange of a session, timed by its own trace.
+
+    Creating a turn cancels the session's previous turn if it is still
+    running (barge-in), so create it before waiting for the session lock.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.trace = metrics.TurnTrace(session_id=session.session_id)
+        self.cancel = cancellation.turns.start(session.session_id)
+        self.answer = ""
+        # Set once the whole answer text was produced, even if a later barge-in cancelled the turn
+        self.complete = False
+
+    # Function to transcribe a recording, returns None when no speech was detected
+    async def transcribe(self, audio_bytes):
+        text, _ = await run_traced(self.trace, transcribe_recording, audio_bytes)
+        return text
+
+    # Function to answer a question in one piece
+    async def ask(self, question):
+        self.answer = await run_traced(
+            self.trace, get_answer, question, list(self.session.history), self.session.memory
+        )
+        self.complete = True
+        return self.answer
+
+    # Function to stream the answer: yields ("token", text), ("audio", bytes) and ("error", message)
+    async def speak(self, question):
+        events = answer_with_speech(question, list(self.session.history), self.session.memory, self.cancel)
+        async with aclosing(iterate_traced(self.trace, events)) as items:
+            async for kind, value in items:
+                if kind == "token":
+                    self.answer += value
+                elif kind == "audio":
+                    self.trace.mark("first_audio")
+                    self.trace.incr("audio_bytes", len(value))
+                yield kind, value
+        self.complete = not self.cancel.cancelled
+
+    # Function to end the turn: add it to the session history, save it and record its metrics
+    async def finish(self, question=None, store=None):
+        """
+        A turn cut short by a cancel or an error keeps its partial answer when
+        Config.keep_partial_answers is set and is otherwise left out of the
+        history; its metrics are recorded either way.
+        """
+        cancellation.turns.finish(self.session.session_id, self.cancel)
+        if self.cancel.cancelled:
+            self.trace.set("cancelled", True)
+        if not self.complete:
+            if Config.keep_partial_answers and self.answer.strip():
+                self.answer += " …"
+            else:
+                question = None
+        if question is not None:
+            messages = [{"role": "user", "content": question}, {"role": "assistant", "content": self.answer}]
+            self.session.history.extend(messages)
+            memory = self.session.memory
+            if store is not None:
+                with self.trace.span("session_save"):
+                    await run_traced(
+                        self.trace, store.append, self.session.session_id, messages,
+                        memory.summary, memory.pop_newly_summarized(),
+                    )
+            memory.trim(self.session.history)
+        metrics.registry.record_turn(self.trace)
+
+
+class ApiHandler(tornado.web.RequestHandler):
+    """Shared helpers for the REST endpoints."""
+
+    def initialize(self, sessions):
+        self.sessions = sessions
+
+    def write_error(self, status_code, **kwargs):
+        self.finish({"error": self._reason})
+
+    # Function to parse the JSON body, an empty body is an empty object
+    def json_body(self):
+        if not self.request.body:
+            return {}
+        try:
+            body = json.loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="Body is not valid JSON")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, reason="Body must be a JSON object")
+        return body
+
+    def session_id(self, body=None):
+        return (
+            (body or {}).get("session_id")
+            or self.request.headers.get("X-Session-Id")
+            or self.get_query_argument("session_id", None)
+        )
+
+    # Function to get the question from the JSON body
+    def question(self, body):
+        question = body.get("question")
+        if not isinstance(question, str) or not question.strip():
+            raise tornado.web.HTTPError(400, reason="Missing question")
+        return question
+
+
+class AskHandler(ApiHandler):
+    """POST /api/ask: text question in, full text answer out."""
+
+    async def post(self):
+        body = self.json_body()
+        question = self.question(body)
+        session = await self.sessions.get(self.session_id(body))
+        turn = Turn(session)
+        async with session.lock:
+            if turn.cancel.cancelled:
+                await turn.finish()
+                raise tornado.web.HTTPError(409, reason="Superseded by a newer question")
+            answer = await turn.ask(question)
+            await turn.finish(question, self.sessions.store)
+        self.write({"session_id": session.session_id, "question": question, "answer": answer})
+
+
+class SpeakHandler(ApiHandler):
+    """
+    POST /api/speak: a JSON question or a raw audio/* recording in, the
+    spoken answer out as a chunked audio stream. Audio starts with the
+    first synthesized sentence, while the model is still generating.
+    """
+
+    async def post(self):
+        content_type = self.request.headers.get("Content-Type", "")
+        if content_type.startswith("audio/"):
+            body = {}
+        else:
+            body = self.json_body()
+        question = self.question(body) if body else None
+        if question is None and not self.request.body:
+            raise tornado.web.HTTPError(400, reason="Missing recording")
+        session = await self.sessions.get(self.session_id(body))
+
+        turn = Turn(session)
+        async with session.lock:
+            try:
+                if question is None:
+                    question = await turn.transcribe(self.request.body)
+                    if question is None:
+                        raise tornado.web.HTTPError(422, reason="No speech detected")
+                if turn.cancel.cancelled:
+                    raise tornado.web.HTTPError(409, reason="Superseded by a newer question")
+
+                self.set_header("Content-Type", AUDIO_MIME_TYPES[Config.tts_format])
+                self.set_header("X-Session-Id", session.session_id)
+                self.set_header("X-Question", tornado.escape.url_escape(question))
+                async with aclosing(turn.speak(question)) as events:
+                    async for kind, value in events:
+                        if kind == "audio":
+                            self.write(value)
+                            # Raises when the client hung up, closing the events cancels the turn
+                            await self.flush()
+            except tornado.iostream.StreamClosedError:
+                pass
+            finally:
+                await turn.finish(question, self.sessions.store)
+
+
+class VoiceSocket(tornado.websocket.WebSocketHandler):
+    """
+    WS /ws: a binary message is a recording, a JSON message
+    {"type": "question", "text": ...} is a typed question. For each turn the
+    server sends {"type": "transcript"} for recordings, {"type": "token"} as
+    the answer streams, binary audio chunks in order and {"type": "done"}.
+
+    A new question while an answer is still streaming barges in: the old
+    turn is cancelled and ends with {"type": "cancelled"}. {"type": "cancel"}
+    cancels without asking anything new.
+    """
+
+    def initialize(self, sessions):
+        self.sessions = sessions
+        self.session = None
+        self.turn = None
+
+    # Function to allow a browser page to connect: same host, or listed in Config.api_allowed_origins
+    def check_origin(self, origin):
+        # Kiosk and IVR clients send no Origin header, tornado only checks browsers
+        return origin.rstrip("/") in Config.api_allowed_origins or super().check_origin(origin)
+
+    async def open(self):
+        self.session = await self.sessions.get(self.get_query_argument("session_id", None))
+        self.send_json({"type": "session", "session_id": self.session.session_id})
+
+    def send_json(self, payload):
+        return self.write_message(json.dumps(payload, ensure_ascii=False))
+
+    # Turns run as tasks so the next message is read, and can barge in, while one is answered
+    def on_message(self, message):
+        question = None
+        if not isinstance(message, bytes):
+            try:
+                payload = json.loads(message)
+            except ValueError:
+                self.send_json({"type": "error", "message": "Message is not valid JSON"})
+                return
+            if isinstance(payload, dict) and payload.get("type") == "cancel":
+                if self.turn is not None:
+                    self.turn.cancel.cancel("client")
+                return
+            question = payload.get("text") if isinstance(payload, dict) else None
+            if not isinstance(question, str) or not question.strip():
+                self.send_json({"type": "error", "message": "Missing question text"})
+                return
+
+        self.turn = Turn(self.session)
+        asyncio.ensure_future(self.run_turn(self.turn, question, message if question is None else None))
+
+    async def run_turn(self, turn, question, recording):
+        async with self.session.lock:
+            self.session.last_used = time.monotonic()
+            closed = False
+            try:
+                if recording is not None:
+                    question = await turn.transcribe(recording)
+                    if question is None:
+                        await self.send_json({"type": "error", "message": "No speech detected"})
+                    else:
+                        await self.send_json({"type": "transcript", "text": question})
+
+                # Skipped when a newer question arrived while this one waited
+                if question is not None and not turn.cancel.cancelled:
+                    async with aclosing(turn.speak(question)) as events:
+                        async for kind, value in events:
+                            if kind == "audio":
+                                await self.write_message(value, binary=True)
+                            elif kind == "token":
+                                await self.send_json({"type": "token", "text": value})
+                            else:
+                                await self.send_json({"type": "error", "message": value})
+            except tornado.websocket.WebSocketClosedError:
+                # The client left mid-turn, closing the events stopped the pipeline
+                closed = True
+            except Exception as e:
+                # e.g. transcription failing after its retries: tell the client, then end the turn
+                try:
+                    await self.send_json({"type": "error", "message": str(e)})
+                except tornado.websocket.WebSocketClosedError:
+                    closed = True
+            finally:
+                await turn.finish(question, self.sessions.store)
+            if closed:
+                return
+
+            ending = "cancelled" if turn.cancel.cancelled else "done"
+            try:
+                await self.send_json({"type": ending, "answer": turn.answer})
+            except tornado.websocket.WebSocketClosedError:
+                pass
+
+    def on_close(self):
+        if self.turn is not None:
+            self.turn.cancel.cancel("disconnected")
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write({"status": "ok"})
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(metrics.registry.prometheus_text())
+
+
+# Function to build the tornado application with one shared session registry
+def make_app(sessions=None):
+    sessions = sessions or SessionRegistry()
+    return tornado.web.Application(
+        [
+            (r"/api/ask", AskHandler, {"sessions": sessions}),
+            (r"/api/speak", SpeakHandler, {"sessions": sessions}),
+            (r"/ws", VoiceSocket, {"sessions": sessions}),
+            (r"/health", HealthHandler),
+            (r"/metrics", MetricsHandler),
+        ],
+        websocket_max_message_size=Config.api_max_body_bytes,
+    )
+
+
+async def serve(host=None, port=None):
+    app = make_app()
+    app.listen(port or Config.port, host or Config.api_host, max_body_size=Config.api_max_body_bytes)
+    print(f"Voice consultant API on http://{host or Config.api_host}:{port or Config.port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the headless voice consultant API")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
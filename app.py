@@ -1,20 +1,33 @@
 import os
+import logging
 import streamlit as st
-from openai import OpenAI
 import base64
+import json
 import time
+import uuid
+from contextlib import closing, contextmanager
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import cancellation
+import metrics
 from voice_api import record_voice
+from openai_client import get_client
+from assistant import answer_with_speech, get_answer, get_synthesizer, prewarm_answer_cache, split_text_for_tts
+from history import ConversationMemory
+from session_store import get_session_store
+from media_server import AUDIO_MIME_TYPES, MediaServer
 from config import Config
 
+logger = logging.getLogger(__name__)
+
 # Set page configuration as the very first Streamlit command
 st.set_page_config(page_title="🎙️ Vodafone | Gen AI Consultant", layout="wide")
 
-# Initialize OpenAI client using secrets
+# Initialize the shared OpenAI client (API key from the environment or secrets)
 @st.cache_resource
 def get_openai_client():
     try:
-        api_key = st.secrets["openai"]["api_key"]
-        return OpenAI(api_key=api_key)
+        return get_client()
     except Exception as e:
         st.error(f"Error initializing OpenAI client: {str(e)}")
         return None
@@ -22,53 +35,202 @@ def get_openai_client():
 # Get the client
 client = get_openai_client()
 
+# Local media server, started once per process. It exports Prometheus metrics
+# at /metrics; audio and the barge-in beacon only go through it when the
+# browser can reach it at Config.media_base_url
+@st.cache_resource
+def get_media_server():
+    if not Config.media_server_enabled:
+        return None
+    # /cancel?sid=... lets the page cancel a session's running turn on barge-in
+    routes = {
+        "/metrics": ("text/plain; version=0.0.4", lambda query: metrics.registry.prometheus_text()),
+        "/cancel": ("text/plain", lambda query: str(
+            cancellation.turns.cancel(query.get("sid", [""])[0], "barge-in")
+        )),
+    }
+    try:
+        return MediaServer(routes=routes)
+    except OSError as e:
+        st.warning(f"Media server unavailable, falling back to inline audio: {str(e)}")
+        return None
+
+media_server = get_media_server()
+
+# Function to get the media server address the browser can use, None when it is local only
+def browser_media_url():
+    if media_server is None or not Config.media_base_url:
+        return None
+    return media_server.base_url
+
+# Function to publish an audio chunk on the app's own origin, with Streamlit's media endpoint
+def publish_audio(audio_bytes):
+    """
+    Every chunk gets its own element coordinates so Streamlit keeps all of
+    them until the session's next full run. Returns None without a runtime.
+    """
+    if not runtime.exists():
+        return None
+    url = runtime.get_instance().media_file_mgr.add(
+        audio_bytes, AUDIO_MIME_TYPES[Config.tts_format], f"vf-audio.{uuid.uuid4().hex}"
+    )
+    # The URL is relative to the server root, the player resolves it in the parent page
+    base_path = st.get_option("server.baseUrlPath").strip("/")
+    return f"/{base_path}{url}" if base_path else url
+
 # Function to encode image to base64
 def get_base64_image(image_path):
     with open(image_path, "rb") as f:
         data = f.read()
     return base64.b64encode(data).decode()
 
-# Function to split text into chunks of maximum length
-def split_text_for_tts(text, max_length=4000):
-    """
-    Split text into chunks that fit within the TTS character limit
-    
-    Args:
-        text (str): Text to split
-        max_length (int): Maximum length of each chunk
-    
-    Returns:
-        list: List of text chunks
+# Page header with the logo inlined, encoded once per process instead of on every rerun
+@st.cache_resource
+def get_header_html(image_path="./vodafone.png"):
+    try:
+        image_base64 = get_base64_image(image_path)
+    except OSError:
+        return None
+    return f"""
+        <h1>
+            <img src="data:image/png;base64,{image_base64}" width="70" style="vertical-align:middle; margin-right:10px;">
+            <b>Vodafone | <span style='color:red;'>Gen AI Consultant</span></b>
+        </h1>
+        """
+
+# Function to time a full script run into the rerun histograms
+@contextmanager
+def timed_rerun(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        metrics.registry.observe(name, seconds)
+        st.session_state.setdefault("rerun_ms", {})[name] = round(seconds * 1000, 1)
+
+# JavaScript audio player installed once in the parent page. Every TTS chunk is
+# pushed onto its queue so playback starts with the first chunk and continues
+# across the separate component iframes created during one answer. Chunks are
+# tagged with their turn, so those of a turn the user barged in on are dropped
+# even when the old run still sends them.
+AUDIO_PLAYER_JS = """
+window.vfAudio = {
+    queue: [],
+    current: null,
+    turn: null,
+    playNext: function () {
+        const player = window.vfAudio;
+        if (player.current || player.queue.length === 0) {
+            return;
+        }
+        player.current = player.queue.shift();
+        player.current.onended = function () {
+            player.current = null;
+            player.playNext();
+        };
+        player.current.play().catch(function () {
+            player.current = null;
+            player.playNext();
+        });
+    },
+    enqueue: function (src, turnId) {
+        if (turnId !== window.vfAudio.turn) {
+            return;
+        }
+        window.vfAudio.queue.push(new Audio(src));
+        window.vfAudio.playNext();
+    },
+    reset: function () {
+        const player = window.vfAudio;
+        if (player.current) {
+            player.current.pause();
+        }
+        player.current = null;
+        player.queue = [];
+    },
+    // Barge-in: a new question stops playback at once and ignores the rest of
+    // the old turn. The server cancels it when the question's full rerun stops
+    // the old run; the /cancel beacon, when the media server is reachable,
+    // cancels it sooner.
+    cancelUrl: null,
+    startTurn: function (turnId, cancelUrl) {
+        const player = window.vfAudio;
+        player.reset();
+        player.turn = turnId;
+        player.cancelUrl = cancelUrl;
+    },
+    endTurn: function (turnId) {
+        if (window.vfAudio.turn === turnId) {
+            window.vfAudio.cancelUrl = null;
+        }
+    },
+    bargeIn: function () {
+        const player = window.vfAudio;
+        player.reset();
+        player.turn = null;
+        if (player.cancelUrl) {
+            navigator.sendBeacon(player.cancelUrl);
+            player.cancelUrl = null;
+        }
+    }
+};
+// Barge in only when a question is asked: Submit with a typed question, or
+// starting the recorder (an iframe, seen as focus moving into it). Other
+// sidebar buttons, such as collapsing it, leave the answer playing.
+document.addEventListener("click", function (event) {
+    const sidebar = document.querySelector('[data-testid="stSidebar"]');
+    const button = event.target.closest ? event.target.closest("button") : null;
+    if (!sidebar || !button || !sidebar.contains(button) || button.innerText.trim() !== "Submit") {
+        return;
+    }
+    const question = sidebar.querySelector("textarea");
+    if (question && question.value.trim() !== "") {
+        window.vfAudio.bargeIn();
+    }
+}, true);
+window.addEventListener("blur", function () {
+    const sidebar = document.querySelector('[data-testid="stSidebar"]');
+    const active = document.activeElement;
+    if (sidebar && active && active.tagName === "IFRAME" && sidebar.contains(active)) {
+        window.vfAudio.bargeIn();
+    }
+});
+"""
+
+# Function to run a command against the parent page audio player
+def run_audio_player(command):
+    script = """
+    <script>
+        const w = window.parent;
+        if (!w.vfAudio) {
+            const s = w.document.createElement("script");
+            s.textContent = """ + json.dumps(AUDIO_PLAYER_JS) + """;
+            w.document.head.appendChild(s);
+        }
+        w.vfAudio.""" + command + """;
+    </script>
     """
-    # Split by sentences for more natural breaks
-    sentences = []
-    for paragraph in text.split('\n'):
-        for sentence in paragraph.split('. '):
-            if sentence:
-                sentences.append(sentence + ('' if sentence.endswith('.') else '.'))
-    
-    chunks = []
-    current_chunk = ""
-    
-    for sentence in sentences:
-        # If adding this sentence would exceed the limit, start a new chunk
-        if len(current_chunk) + len(sentence) + 1 > max_length:
-            chunks.append(current_chunk)
-            current_chunk = sentence
-        else:
-            if current_chunk:
-                current_chunk += " " + sentence
-            else:
-                current_chunk = sentence
-    
-    # Add the last chunk if it has content
-    if current_chunk:
-        chunks.append(current_chunk)
-    
-    return chunks
+    metrics.incr("html_bytes", len(script))
+    st.components.v1.html(script, height=0)
+
+# Function to queue one synthesized audio chunk of a turn for playback
+def play_audio_chunk(audio_bytes, turn_id):
+    metrics.mark("first_audio")
+    metrics.incr("audio_bytes", len(audio_bytes))
+    # The browser streams the chunk by URL with range requests, from the app's
+    # own origin unless the media server is reachable at Config.media_base_url
+    if browser_media_url() is not None:
+        src = media_server.publish(audio_bytes, Config.tts_format)
+    else:
+        src = publish_audio(audio_bytes)
+    if src is None:
+        b64_audio = base64.b64encode(audio_bytes).decode()
+        src = f"data:{AUDIO_MIME_TYPES[Config.tts_format]};base64,{b64_audio}"
+    run_audio_player(f"enqueue({json.dumps(src)}, {json.dumps(turn_id)})")
 
 # Function to handle text-to-speech
-def speak_text(text, ai_message):
+def speak_text(text, ai_message, cancel=None, turn_id=None):
     try:
         # Display the AI message
         print_chat_message(ai_message)
@@ -76,49 +238,13 @@ def speak_text(text, ai_message):
         # Split text into chunks
         text_chunks = split_text_for_tts(text)
 
-        # Prepare list of audio base64 chunks
-        audio_b64_chunks = []
-
-        for i, chunk in enumerate(text_chunks):
-            if chunk.strip():
-                try:
-                    response = client.audio.speech.create(
-                        model="tts-1",  # use correct model
-                        voice="alloy",
-                        input=chunk,
-                    )
-                    audio_bytes = response.read()
-                    b64_audio = base64.b64encode(audio_bytes).decode()
-                    audio_b64_chunks.append(b64_audio)
-                except Exception as e:
-                    st.error(f"❌ TTS chunk {i} generation failed: {str(e)}")
-
-        # Generate JavaScript to play each chunk sequentially
-        js_chunks = ""
-        for i, b64 in enumerate(audio_b64_chunks):
-            js_chunks += f"""
-                audios[{i}] = new Audio("data:audio/mp3;base64,{b64}");
-            """
-
-        js_play_sequence = """
-        <script>
-            const audios = [];
-            let current = 0;
-
-            function playNext() {
-                if (current < audios.length) {
-                    audios[current].onended = playNext;
-                    audios[current].play();
-                    current++;
-                }
-            }
-
-            """ + js_chunks + """
-            playNext();
-        </script>
-        """
-
-        st.components.v1.html(js_play_sequence, height=0)
+        # Synthesize all chunks concurrently and play them in order as they arrive
+        text_chunks = [chunk for chunk in text_chunks if chunk.strip()]
+        for i, audio_bytes, error in get_synthesizer().synthesize_in_order(text_chunks, cancel):
+            if error is not None:
+                st.error(f"❌ TTS chunk {i} generation failed: {str(error)}")
+            else:
+                play_audio_chunk(audio_bytes, turn_id)
     except Exception as e:
         st.error(f"❌ TTS failed: {str(e)}")
 
@@ -132,110 +258,250 @@ def print_chat_message(message):
         with st.chat_message("assistant", avatar="🤖"):
             st.markdown(text)
 
-# Function to get answer from the model directly
-def get_answer(question, history=[]):
-    if question.strip() == "":
-        return Config.fall_back_msg
-    
-    messages = [
-        {"role": "system", "content": Config.prompt}
-    ]
-    
-    # Add chat history
-    for i, conv in enumerate(history):
-        # Skip the first message if it's an intro
-        if i == 0:
-            continue
-        messages.append(conv)
-    
-    # Add the current question
-    messages.append({"role": "user", "content": question})
-    
+# Function to render a streamed answer while speaking it sentence by sentence
+def stream_and_speak(question, history=[], memory=None, ai_message=None, cancel=None, turn_id=None):
+    """
+    Render the answer as it streams in and play each sentence as soon as it
+    is synthesized, so the first audio starts while the model is still generating.
+
+    The text so far is kept in ai_message["content"], so an interrupted
+    turn still has its partial answer.
+
+    Returns:
+        str: The answer text, partial when the turn was cancelled
+    """
+    ai_message = ai_message if ai_message is not None else {"role": "assistant", "content": ""}
+
+    with st.chat_message("assistant", avatar="🤖"):
+        placeholder = st.empty()
+
+        with closing(answer_with_speech(question, history, memory, cancel)) as events:
+            for kind, value in events:
+                if kind == "token":
+                    ai_message["content"] += value
+                    placeholder.markdown(ai_message["content"] + "▌")
+                elif kind == "audio":
+                    play_audio_chunk(value, turn_id)
+                else:
+                    st.error(value)
+
+        placeholder.markdown(ai_message["content"])
+
+    return ai_message["content"]
+
+# Function to get this conversation's id, kept in the URL so a reload or another worker resumes it
+def get_session_id():
+    session_id = st.query_params.get("sid")
+    if not session_id:
+        session_id = uuid.uuid4().hex
+        st.query_params["sid"] = session_id
+    return session_id
+
+# Function to restore the conversation and its summary from the session store
+def load_conversation():
+    state = None
+    store = get_session_store()
+    if store is not None:
+        try:
+            state = store.load(get_session_id())
+        except Exception as e:
+            st.warning(f"Could not restore the conversation: {str(e)}")
+    st.session_state.chat_history = state.history if state else []
+    st.session_state.conversation_memory = ConversationMemory(
+        summary=state.summary if state else "",
+        summarized=state.summarized if state else 0,
+    )
+    st.session_state.conversation_memory.trim(st.session_state.chat_history)
+
+# Function to append a finished turn to the session store
+def save_turn(session_id, messages, memory):
+    """
+    Also runs while Streamlit stops an interrupted run, so it makes no
+    Streamlit calls: a failed save is logged, not shown.
+    """
+    store = get_session_store()
+    if store is None:
+        return
     try:
-        # Call the OpenAI API directly (non-streaming)
-        response = client.chat.completions.create(
-            model=Config.model,
-            messages=messages,
-            temperature=Config.temperature,
-            top_p=1
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"⚠️ Error: {str(e)}"
+        with metrics.span("session_save"):
+            store.append(session_id, messages, memory.summary, memory.pop_newly_summarized())
+    except Exception:
+        logger.exception("Could not save conversation %s", session_id)
+
+# Function to show the latency breakdown of the session's last turns in the sidebar
+def show_turn_metrics():
+    turns = st.session_state.get("turn_metrics", [])
+    reruns = st.session_state.get("rerun_ms", {})
+    if not turns and not reruns:
+        return
+    with st.sidebar.expander("⏱️ Latency of recent turns"):
+        if reruns:
+            st.caption(" · ".join(f"{name}: {ms} ms" for name, ms in sorted(reruns.items())))
+        if turns:
+            st.table([metrics.summarize_turn(record) for record in reversed(turns)])
+
+# Sidebar input: switching tabs and typing run nothing on the server
+def input_panel():
+    """
+    Only submitting the form or finishing a recording reruns the app, and
+    that full rerun is what barges in: Streamlit stops a run still answering
+    the previous question for it, where a fragment rerun would wait for
+    that run to finish.
+
+    Returns:
+        tuple: (question or None, the turn's trace when the question was spoken)
+    """
+    st.title("Ask your question")
+
+    # Text and voice input, switched in the browser
+    text_tab, voice_tab = st.tabs(["Text", "Voice"])
+
+    with text_tab:
+        with st.form("question_form", border=False):
+            text = st.text_area("Type your question:", height=100)
+            submitted = st.form_submit_button("Submit")
+
+    with voice_tab:
+        st.write("Click to record your voice question:")
+        # Transcription is part of the turn, so it is timed against the turn's trace
+        ctx = get_script_run_ctx()
+        trace = metrics.TurnTrace(session_id=ctx.session_id if ctx else None)
+        metrics.set_current_trace(trace)
+        try:
+            spoken = record_voice(language="en")
+        finally:
+            metrics.set_current_trace(None)
+
+    if spoken:
+        return spoken, trace
+    if submitted and text.strip():
+        return text, None
+    return None, None
+
+# New turn: the pending question and its streamed, spoken answer
+@st.fragment
+def new_turn(question, trace):
+    history = st.session_state.chat_history
+    memory = st.session_state.conversation_memory
+    metrics.set_current_trace(trace)
+
+    # A new question cancels whatever this conversation's previous turn is still
+    # generating, on any worker thread, and the page only plays this turn's audio
+    session_id = get_session_id()
+    cancel = cancellation.turns.start(session_id)
+    turn_id = uuid.uuid4().hex
+    cancel_url = None
+    if browser_media_url() is not None:
+        cancel_url = f"{browser_media_url()}/cancel?sid={session_id}"
+    run_audio_player(f"startTurn({json.dumps(turn_id)}, {json.dumps(cancel_url)})")
+
+    # Everything said before this question
+    previous = list(history)
+
+    user_message = {"role": "user", "content": question}
+    history.append(user_message)
+    print_chat_message(user_message)
+
+    ai_message = {"role": "assistant", "content": ""}
+    # The answer text can be complete even if its speech was cut short
+    finished = text_complete = False
+    try:
+        if Config.stream_answers:
+            # Stream the answer and speak it while it is being generated
+            stream_and_speak(question, previous, memory, ai_message, cancel, turn_id)
+            text_complete = not cancel.cancelled
+        else:
+            # Get answer directly from the model
+            ai_message["content"] = get_answer(question, previous, memory)
+            text_complete = True
+
+            # Display the answer and convert it to speech
+            if not cancel.cancelled:
+                speak_text(ai_message["content"], ai_message, cancel, turn_id)
+        finished = not cancel.cancelled
+        if cancel_url is not None:
+            run_audio_player(f"endTurn({json.dumps(turn_id)})")
+    finally:
+        # Also reached when Streamlit stops this run for a new one: no
+        # Streamlit calls here, only cancelling the work and saving the turn
+        if not finished:
+            cancel.cancel("interrupted")
+            trace.set("cancelled", True)
+        cancellation.turns.finish(session_id, cancel)
+        end_turn(trace, session_id, user_message, ai_message, memory, text_complete)
+
+# Function to add a turn to the history, save it and record its metrics
+def end_turn(trace, session_id, user_message, ai_message, memory, finished=True):
+    """
+    Args:
+        session_id (str): The conversation id, resolved before the turn started
+        finished (bool): The answer text is complete; a partial one is kept,
+            marked, only when Config.keep_partial_answers is set
+    """
+    history = st.session_state.chat_history
+    if finished or (Config.keep_partial_answers and ai_message["content"].strip()):
+        if not finished:
+            ai_message["content"] += " …"
+        # Add the message to history, the conversation memory keeps what is
+        # sent to the model within Config.history_token_budget
+        history.append(ai_message)
+
+        # Only the new turn is written, so any worker can pick the conversation up
+        save_turn(session_id, [user_message, ai_message], memory)
+
+        # Old turns already in the summary are no longer kept or rendered
+        memory.trim(history)
+    elif history and history[-1] is user_message:
+        # An interrupted turn with nothing worth keeping is dropped
+        history.pop()
+
+    # Record the turn, finished or not: JSONL log, /metrics and the sidebar panel
+    record = metrics.registry.record_turn(trace)
+    turns = st.session_state.setdefault("turn_metrics", [])
+    turns.append(record)
+    del turns[:-Config.metrics_recent_turns]
+    metrics.set_current_trace(None)
 
 # Main function
 def main():
-    # Try to load the logo
-    try:
-        image_base64 = get_base64_image("./vodafone.png")
-        st.markdown(
-            f"""
-            <h1>
-                <img src="data:image/png;base64,{image_base64}" width="70" style="vertical-align:middle; margin-right:10px;">
-                <b>Vodafone | <span style='color:red;'>Gen AI Consultant</span></b>
-            </h1>
-            """,
-            unsafe_allow_html=True
-        )
-    except Exception:
-        st.title("🎙️ Vodafone | Gen AI Consultant")
-    
-    # Sidebar for input method selection
-    st.sidebar.title("Ask your question")
-    
-    # Toggle between voice and text input
-    input_method = st.sidebar.radio("Input Method", ["Text", "Voice"])
-    
-    # Get user question based on selected input method
-    question = None
-    
-    if input_method == "Voice":
-        with st.sidebar:
-            st.write("Click to record your voice question:")
-            question = record_voice(language="en")
-    else:  # Text input
+    # Full runs happen on page load and once per submitted question
+    with timed_rerun("rerun_app"):
+        # Pre-warm the answer cache once per process
+        if Config.answer_cache_enabled and Config.answer_cache_prewarm:
+            prewarm_answer_cache(tuple(Config.prewarm_questions))
+
+        # Logo header, cached per process
+        header_html = get_header_html()
+        if header_html is not None:
+            st.markdown(header_html, unsafe_allow_html=True)
+        else:
+            st.title("🎙️ Vodafone | Gen AI Consultant")
+
+        # Sidebar for input method selection
         with st.sidebar:
-            question = st.text_area("Type your question:", height=100)
-            if st.button("Submit"):
-                # This will trigger the question processing
-                st.session_state["submitted"] = True
-            else:
-                # If the button wasn't pressed, don't process empty text input
-                if not st.session_state.get("submitted", False):
-                    question = None
-    
-    # Initialize chat history
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
-    
-    # Show previous messages
-    for message in st.session_state.chat_history:
-        print_chat_message(message)
-    
-    # Process new question if provided
+            question, trace = input_panel()
+
+        # Initialize chat history, resumed from the session store when the URL has a session id
+        if "chat_history" not in st.session_state:
+            load_conversation()
+
+        # A question submitted from the input panel is answered on this run
+        if question and trace is None:
+            ctx = get_script_run_ctx()
+            trace = metrics.TurnTrace(session_id=ctx.session_id if ctx else None)
+        metrics.set_current_trace(trace if question else None)
+
+        # Show previous messages
+        with metrics.span("render_history", messages=len(st.session_state.chat_history)):
+            for message in st.session_state.chat_history:
+                print_chat_message(message)
+
+    # The turn itself is measured by its trace, not as rerun time
     if question:
-        user_message = {"role": "user", "content": question}
-        st.session_state.chat_history.append(user_message)
-        print_chat_message(user_message)
-        
-        # Get answer directly from the model
-        answer = get_answer(question, st.session_state.chat_history)
-        
-        # Display the answer
-        ai_message = {"role": "assistant", "content": answer}
-        
-        # Convert answer to speech
-        speak_text(answer, ai_message)
-        
-        # Add the message to history
-        st.session_state.chat_history.append(ai_message)
-        
-        # Keep only last 20 messages for context window management
-        if len(st.session_state.chat_history) > 20:
-            st.session_state.chat_history = st.session_state.chat_history[-20:]
-        
-        # Reset the submitted state for text input
-        st.session_state["submitted"] = False
+        new_turn(question, trace)
+
+    if Config.metrics_sidebar:
+        show_turn_metrics()
 
 if __name__ == "__main__":
     main()
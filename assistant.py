@@ -0,0 +1,319 @@
+import io
+from contextlib import closing
+import threading
+import metrics
+from openai_client import chat_completion, transcription
+from tts_engine import SpeechSynthesizer
+from tts_cache import AudioCache
+from answer_cache import AnswerCache
+from prompt_builder import build_system_prompt
+from history import summarize_history
+from audio_processing import preprocess_recording
+from cancellation import CancelToken
+from tts_text import chunk_sentences, normalize_for_speech, sentence_ends, split_sentences
+from config import Config
+
+# The STT -> answer -> TTS pipeline without any Streamlit dependency, shared
+# by the Streamlit app and headless callers such as the benchmark.
+
+_resources_lock = threading.Lock()
+_synthesizer = None
+_answer_cache = None
+_prewarm_thread = None
+
+# Shared speech synthesizer, its thread pool caps TTS requests for the whole process
+def get_synthesizer():
+    global _synthesizer
+    with _resources_lock:
+        if _synthesizer is None:
+            cache = AudioCache() if Config.tts_cache_enabled else None
+            if cache is not None:
+                # Hits, misses and size of the shared cache, at /metrics
+                metrics.registry.add_gauges("tts_cache", cache.stats)
+            _synthesizer = SpeechSynthesizer(cache=cache)
+        return _synthesizer
+
+# Shared answer cache, repeated questions skip the chat call entirely
+def get_answer_cache():
+    global _answer_cache
+    with _resources_lock:
+        if _answer_cache is None and Config.answer_cache_enabled:
+            _answer_cache = AnswerCache()
+        return _answer_cache
+
+# Function to split an answer into speakable chunks for TTS
+def split_text_for_tts(text, max_length=None):
+    """
+    Split text into chunks that fit within the TTS character limit
+
+    Markdown, links, images and emojis are removed first so they are
+    neither spoken nor billed. The first chunk is small so its audio is
+    ready quickly; later chunks grow up to max_length.
+
+    Args:
+        text (str): Text to split
+        max_length (int): Maximum length of each chunk
+
+    Returns:
+        list: List of text chunks
+    """
+    sentences = split_sentences(normalize_for_speech(text))
+    return chunk_sentences(sentences, max_length=max_length)
+
+# Function to pop the finished sentences off the front of a streaming buffer
+def pop_sentences(buffer, min_length=None):
+    """
+    Split the finished sentences off a partially streamed answer
+
+    Args:
+        buffer (str): Text received so far that has not been spoken yet
+        min_length (int): Sentences shorter than this are merged with the next one
+
+    Returns:
+        tuple: (list of finished sentences, remaining unfinished text)
+    """
+    if min_length is None:
+        min_length = Config.tts_min_sentence_chars
+
+    sentences = []
+    start = 0
+    for end in sentence_ends(buffer):
+        if len(buffer[start:end].strip()) >= min_length:
+            sentences.append(buffer[start:end].strip())
+            start = end
+
+    return sentences, buffer[start:]
+
+# Function to queue a raw answer fragment for TTS, skipping text with nothing to say
+def submit_speech(synthesizer, text, pending_audio):
+    speakable = normalize_for_speech(text)
+    if any(char.isalnum() for char in speakable):
+        pending_audio.append((synthesizer.submit(speakable), speakable))
+
+# Function to build the message list sent to the chat model
+def build_messages(question, history=[], memory=None):
+    """
+    Args:
+        question (str): The current question
+        history (list): Previous messages, not including the current question
+        memory (ConversationMemory): Keeps history within the token budget when given
+
+    Returns:
+        list: Messages for the chat completion call
+    """
+    # Only the prompt sections this question needs are sent
+    system_prompt, report = build_system_prompt(question, history)
+    metrics.incr("prompt_tokens_saved", report["saved_tokens"])
+    messages = [
+        {"role": "system", "content": system_prompt}
+    ]
+    
+    # Add chat history, older turns folded into a summary when over budget
+    if memory is not None:
+        messages.extend(memory.context(history, summarize_history))
+    else:
+        messages.extend(history)
+    
+    # Add the current question
+    messages.append({"role": "user", "content": question})
+    return messages
+
+# Function to get answer from the model directly
+def get_answer(question, history=[], memory=None):
+    if question.strip() == "":
+        return Config.fall_back_msg
+    
+    messages = build_messages(question, history, memory)
+
+    # Serve repeated questions from the answer cache
+    cache_key = AnswerCache.make_key(Config.model, messages)
+    answer_cache = get_answer_cache()
+    if answer_cache is not None:
+        cached = answer_cache.get(cache_key)
+        if cached is not None:
+            metrics.incr("answer_cache_hits")
+            return cached
+    
+    try:
+        # Call the OpenAI API directly (non-streaming)
+        with metrics.span("llm"):
+            response = chat_completion(
+                model=Config.model,
+                messages=messages,
+                temperature=Config.temperature,
+                top_p=1
+            )
+        answer = response.choices[0].message.content
+        if response.usage is not None:
+            metrics.incr("prompt_tokens", response.usage.prompt_tokens)
+            metrics.incr("completion_tokens", response.usage.completion_tokens)
+    except Exception as e:
+        return f"⚠️ Error: {str(e)}"
+
+    if answer_cache is not None:
+        answer_cache.put(cache_key, answer)
+    return answer
+
+# Function to stream the answer from the model token by token
+def stream_answer(question, history=[], memory=None, cancel=None):
+    if question.strip() == "":
+        yield Config.fall_back_msg
+        return
+
+    messages = build_messages(question, history, memory)
+
+    # A cached answer is yielded in one piece
+    cache_key = AnswerCache.make_key(Config.model, messages)
+    answer_cache = get_answer_cache()
+    if answer_cache is not None:
+        cached = answer_cache.get(cache_key)
+        if cached is not None:
+            metrics.incr("answer_cache_hits")
+            yield cached
+            return
+
+    trace = metrics.current_trace()
+    started = trace.now_ms() if trace is not None else 0
+    stream = chat_completion(
+        model=Config.model,
+        messages=messages,
+        temperature=Config.temperature,
+        top_p=1,
+        stream=True,
+        # The last chunk then carries the token usage of the request
+        stream_options={"include_usage": True}
+    )
+    # Cancelling the turn closes the stream, the model stops generating for us
+    def abort():
+        if stream.close():
+            metrics.registry.incr("llm_streams_cancelled")
+    if cancel is not None:
+        cancel.on_cancel(abort)
+
+    answer = ""
+    for chunk in stream:
+        if cancel is not None and cancel.cancelled:
+            return
+        if chunk.usage is not None and trace is not None:
+            trace.incr("prompt_tokens", chunk.usage.prompt_tokens)
+            trace.incr("completion_tokens", chunk.usage.completion_tokens)
+        if chunk.choices and chunk.choices[0].delta.content:
+            if trace is not None:
+                trace.mark("llm_first_token")
+            answer += chunk.choices[0].delta.content
+            yield chunk.choices[0].delta.content
+    if trace is not None:
+        trace.add_span("llm", started, trace.now_ms() - started, chars=len(answer))
+
+    # Only answers that streamed to completion are cached
+    if answer_cache is not None and answer and not (cancel is not None and cancel.cancelled):
+        answer_cache.put(cache_key, answer)
+
+# Function to fill the answer cache from a list of known questions
+def prewarm_answer_cache(questions):
+    """
+    Answer each known question once in a background thread so the first
+    user to ask it is served from the cache. Runs once per process.
+    """
+    global _prewarm_thread
+
+    def warm():
+        for question in questions:
+            get_answer(question)
+
+    with _resources_lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(target=warm, name="answer-cache-prewarm", daemon=True)
+            _prewarm_thread.start()
+        return _prewarm_thread
+
+# Function to stream an answer and synthesize it sentence by sentence
+def answer_with_speech(question, history=[], memory=None, cancel=None):
+    """
+    Stream the answer and pipeline each finished sentence into TTS while the
+    model is still generating.
+
+    When the turn is cancelled (a new question barged in) or the consumer
+    stops iterating, the chat stream is closed and queued sentences are
+    never synthesized.
+
+    Yields:
+        tuple: ("token", text) as the answer streams in, ("audio", bytes) for
+        each synthesized sentence in order, ("error", message) on failures
+    """
+    cancel = cancel or CancelToken()
+    synthesizer = get_synthesizer()
+    buffer = ""
+    pending_audio = []
+    cancel.on_cancel(lambda: synthesizer.cancel_pending(pending_audio))
+
+    # Sentences are synthesized concurrently on the shared pool and handed
+    # back strictly in order as soon as the next one is ready
+    def finished_audio(wait=False):
+        while pending_audio and not cancel.cancelled and (wait or pending_audio[0][0].done()):
+            future, _ = pending_audio.pop(0)
+            try:
+                yield "audio", future.result()
+            except Exception as e:
+                if not cancel.cancelled:
+                    yield "error", f"❌ TTS generation failed: {str(e)}"
+
+    completed = False
+    try:
+        try:
+            with closing(stream_answer(question, history, memory, cancel)) as tokens:
+                for token in tokens:
+                    buffer += token
+                    yield "token", token
+
+                    sentences, buffer = pop_sentences(buffer)
+                    for sentence in sentences:
+                        submit_speech(synthesizer, sentence, pending_audio)
+                    yield from finished_audio()
+        except Exception as e:
+            # A stream closed by cancellation fails, that is not an error to report
+            if cancel.cancelled:
+                return
+            yield "token", f"⚠️ Error: {str(e)}"
+
+        if not cancel.cancelled:
+            submit_speech(synthesizer, buffer, pending_audio)
+            yield from finished_audio(wait=True)
+        completed = not cancel.cancelled
+    finally:
+        if not completed:
+            cancel.cancel("abandoned")
+
+# Function to transcribe audio bytes with Whisper
+def transcribe_audio(audio_bytes, language="en"):
+    audio_stream = io.BytesIO(audio_bytes)
+    audio_stream.name = "audio.wav"  # Required for OpenAI API
+    
+    # Shared client: pooled connections, timeouts, retries and rate limiting
+    with metrics.span("stt", bytes_sent=len(audio_bytes)):
+        response = transcription(
+            model="whisper-1",
+            file=audio_stream,
+            language=language
+        )
+    return response.text.strip()
+
+# Function to trim, compress and transcribe a recording
+def transcribe_recording(audio_bytes, language="en"):
+    """
+    Returns:
+        tuple: (transcript or None when no speech was detected, pre-processing stats or None)
+    """
+    stats = None
+    if Config.stt_preprocess:
+        try:
+            with metrics.span("stt_preprocess") as span_attrs:
+                prepared, stats = preprocess_recording(audio_bytes)
+                span_attrs.update(stats)
+            if prepared is None:
+                return None, stats
+            audio_bytes = prepared
+        except Exception:
+            # Not a PCM WAV we can decode, upload it unchanged
+            pass
+    return transcribe_audio(audio_bytes, language), stats
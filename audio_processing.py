@@ -0,0 +1,160 @@
+import io
+import struct
+import time
+import wave
+import numpy as np
+from config import Config
+
+
+# Function to decode PCM WAV bytes into float samples in [-1, 1]
+def decode_wav(data):
+    """
+    Args:
+        data (bytes): A PCM WAV file as recorded by mic_recorder
+
+    Returns:
+        tuple: (samples as a float32 array of shape (frames, channels), sample rate)
+    """
+    with wave.open(io.BytesIO(data), "rb") as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        rate = wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768
+    elif width == 3:
+        bytes3 = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        ints = (bytes3[:, 0].astype(np.int32) | (bytes3[:, 1].astype(np.int32) << 8)
+                | (bytes3[:, 2].astype(np.int32) << 16))
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+        samples = ints.astype(np.float32) / (1 << 23)
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / (1 << 31)
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width}")
+    return samples.reshape(-1, channels), rate
+
+
+# Function to downmix any number of channels to mono
+def to_mono(samples):
+    return samples.mean(axis=1) if samples.ndim == 2 else samples
+
+
+# Function to find the speech span with an energy-based voice activity detector
+def speech_bounds(samples, rate):
+    """
+    Frames are 20 ms. A frame is speech when its RMS level is above an
+    absolute floor and a margin over the recording's noise floor (the 10th
+    percentile frame level).
+
+    Returns:
+        tuple: (start, end) sample indices including padding, or None when no speech was found
+    """
+    frame = max(int(rate * 0.02), 1)
+    count = len(samples) // frame
+    if count == 0:
+        return None
+
+    frames = samples[:count * frame].reshape(count, frame)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1) + 1e-12)
+    level_db = 20 * np.log10(rms)
+    threshold = max(Config.vad_floor_db, np.percentile(level_db, 10) + Config.vad_margin_db)
+    voiced = np.flatnonzero(level_db > threshold)
+    if len(voiced) == 0:
+        return None
+
+    padding = int(rate * Config.vad_padding_ms / 1000)
+    start = max(voiced[0] * frame - padding, 0)
+    end = min((voiced[-1] + 1) * frame + padding, len(samples))
+    return start, end
+
+
+# Function to resample with a windowed-sinc low-pass followed by linear interpolation
+def resample(samples, rate, target_rate):
+    if rate == target_rate or len(samples) == 0:
+        return samples
+    if target_rate < rate:
+        cutoff = target_rate / rate / 2
+        taps = np.arange(-32, 33)
+        kernel = np.sinc(2 * cutoff * taps) * np.hamming(len(taps))
+        samples = np.convolve(samples, kernel / kernel.sum(), mode="same")
+    duration = len(samples) / rate
+    target_times = np.arange(int(duration * target_rate)) / target_rate
+    return np.interp(target_times, np.arange(len(samples)) / rate, samples).astype(np.float32)
+
+
+# Function to encode float samples with G.711 mu-law, 8 bits per sample
+def mulaw_encode(samples):
+    samples = np.clip(samples, -1.0, 1.0)
+    pcm = (samples * 32767).astype(np.int32)
+    sign = np.where(pcm < 0, 0x80, 0x00)
+    magnitude = np.minimum(np.abs(pcm), 32635) + 0x84
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 7
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8).tobytes()
+
+
+# Function to write mono samples as a WAV file, 16-bit PCM or 8-bit mu-law
+def encode_wav(samples, rate, encoding="pcm16"):
+    if encoding == "mulaw":
+        payload = mulaw_encode(samples)
+        # WAVE_FORMAT_MULAW needs the extended fmt chunk and a fact chunk
+        fmt = struct.pack("<HHIIHHH", 7, 1, rate, rate, 1, 8, 0)
+        return b"".join([
+            b"RIFF", struct.pack("<I", 4 + 8 + len(fmt) + 12 + 8 + len(payload)), b"WAVE",
+            b"fmt ", struct.pack("<I", len(fmt)), fmt,
+            b"fact", struct.pack("<II", 4, len(payload)),
+            b"data", struct.pack("<I", len(payload)), payload,
+        ])
+
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes((np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+    return out.getvalue()
+
+
+# Function to prepare a voice recording for upload to Whisper
+def preprocess_recording(data):
+    """
+    Trim silence, downmix, resample to 16 kHz mono and re-encode a recording
+
+    Args:
+        data (bytes): WAV bytes from mic_recorder
+
+    Returns:
+        tuple: (bytes to upload or None when no speech was detected, stats dict)
+    """
+    started = time.perf_counter()
+    samples, rate = decode_wav(data)
+    mono = to_mono(samples)
+    original_seconds = len(mono) / rate if rate else 0.0
+
+    bounds = speech_bounds(mono, rate)
+    stats = {
+        "original_bytes": len(data),
+        "original_seconds": round(original_seconds, 3),
+        "original_rate": rate,
+        "original_channels": samples.shape[1],
+        "speech": bounds is not None,
+    }
+    if bounds is None:
+        stats.update(sent_bytes=0, sent_seconds=0.0, trimmed_seconds=round(original_seconds, 3))
+        stats["processing_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return None, stats
+
+    speech = resample(mono[bounds[0]:bounds[1]], rate, Config.stt_sample_rate)
+    encoded = encode_wav(speech, Config.stt_sample_rate, Config.stt_encoding)
+    sent_seconds = len(speech) / Config.stt_sample_rate
+    stats.update(
+        sent_bytes=len(encoded),
+        sent_seconds=round(sent_seconds, 3),
+        trimmed_seconds=round(original_seconds - sent_seconds, 3),
+        processing_ms=round((time.perf_counter() - started) * 1000, 1),
+    )
+    return encoded, stats
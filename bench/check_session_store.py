@@ -0,0 +1,112 @@
+"""
+Checks the session stores offline: the SQLite store on a temporary file and
+the Redis store against the local fake Redis server.
+
+    python bench/check_session_store.py
+
+Each store is checked for the append/load round trip, the size cap (only
+whole turns already in the summary are dropped) and session expiry. The exit
+code is 1 when a check fails.
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_redis import FakeRedisServer
+from history import ConversationMemory
+from session_store import RedisSessionStore, SQLiteSessionStore
+
+
+# Function to build one question/answer turn of a given size
+def make_turn(index, size=60):
+    return [
+        {"role": "user", "content": f"Question {index}: " + "q" * size},
+        {"role": "assistant", "content": f"Answer {index} 🏪: " + "a" * size},
+    ]
+
+
+# Function to fold messages into a summary without the chat model
+def fake_summarize(previous_summary, messages):
+    return (previous_summary + " " + " ".join(m["content"].split(":")[0] for m in messages)).strip()
+
+
+# Function to run the checks against one store, returns the failed ones
+def check_store(make_store):
+    failures = []
+
+    def expect(condition, message):
+        if not condition:
+            failures.append(message)
+
+    # Round trip
+    store = make_store(ttl=60, max_bytes=1024 * 1024)
+    turn = make_turn(0, size=400)
+    store.append("roundtrip", turn, "summary", 0)
+    state = store.load("roundtrip")
+    expect(state.history == turn, "append/load round trip changed the messages")
+    expect(state.summary == "summary" and state.summarized == 0, "append/load lost the summary")
+    expect(store.load("unknown").history == [], "an unknown session is not empty")
+
+    # Size cap: a conversation driven like the app, saved turn by turn
+    store = make_store(ttl=60, max_bytes=600)
+    memory = ConversationMemory(token_budget=80)
+    history = []
+    for index in range(8):
+        memory.context(history, fake_summarize)
+        turn = make_turn(index)
+        history.extend(turn)
+        store.append("capped", turn, memory.summary, memory.pop_newly_summarized())
+    state = store.load("capped")
+    unsummarized = history[memory.summarized:]
+    expect(len(state.history) < len(history), "the size cap dropped nothing")
+    expect(state.history and state.history[0]["role"] == "user", "the stored history does not start with a question")
+    expect(state.summarized <= len(state.history), "the summarized count is past the stored messages")
+    expect(
+        state.history[state.summarized:] == unsummarized,
+        "the stored unsummarized messages differ from the conversation's",
+    )
+    resumed = ConversationMemory(token_budget=80, summary=state.summary, summarized=state.summarized)
+    expect(
+        resumed.context(state.history, fake_summarize) == memory.context(history, fake_summarize),
+        "a resumed conversation sends a different context",
+    )
+
+    # Expiry
+    store = make_store(ttl=1, max_bytes=1024 * 1024)
+    store.append("expiring", make_turn(0), "summary", 2)
+    time.sleep(1.2)
+    expect(store.load("expiring").history == [], "an expired session was still loaded")
+    store.append("expiring", make_turn(1), None, 0)
+    state = store.load("expiring")
+    expect(len(state.history) == 2 and state.summarized == 0, "an expired session was not started over")
+    return failures
+
+
+def main():
+    redis_server = FakeRedisServer().start()
+    directory = tempfile.mkdtemp(prefix="session-store-")
+    stores = {
+        "sqlite": lambda **kwargs: SQLiteSessionStore(os.path.join(directory, f"{time.time_ns()}.sqlite3"), **kwargs),
+        "redis": lambda **kwargs: RedisSessionStore(redis_server.url, prefix=f"check:{time.time_ns()}:", **kwargs),
+    }
+    failed = False
+    try:
+        for name, make_store in stores.items():
+            failures = check_store(make_store)
+            for failure in failures:
+                print("FAIL", name, failure)
+            if not failures:
+                print("OK", name)
+            failed = failed or bool(failures)
+    finally:
+        redis_server.shutdown()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
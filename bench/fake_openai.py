@@ -0,0 +1,224 @@
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Canned consultant answer, long enough to exercise sentence pipelining and chunking
+DEFAULT_ANSWER = (
+    "🏪 Here are the top recommended locations for new Vodafone retail stores. "
+    "1. **Qatamia, Cairo**: Vodafone's acquisition market share is 34%, which is below 45% and flagged as low. "
+    "Etisalat holds 32% and the nearest Vodafone store is almost 4 km away. "
+    "📍 [Ideal store location](https://www.google.com/maps?q=29.977,31.391)\n"
+    "2. **10th of Ramadan, Sharkia**: Orange leads with 24% while Vodafone sits at 44%. "
+    "The area has an extremely high population and visitors per terminal, so demand is underserved.\n"
+    "3. **Mahalla El Kobra, Gharbia**: A dense market with several competitor stores nearby. "
+    "A new store here would defend share against Orange and improve access for existing customers.\n"
+    "💡 Overall, these locations combine low Vodafone penetration with strong footfall, "
+    "making them the best candidates for the next expansion wave."
+)
+
+
+class FakeOpenAIConfig:
+    """Latency, streaming and error behaviour of the fake server, in milliseconds."""
+
+    def __init__(self, chat_ttft_ms=400, chat_token_ms=15, tts_base_ms=250, tts_ms_per_char=1.5,
+                 stt_base_ms=300, stt_ms_per_kb=2.0, error_rate=0.0, answer=DEFAULT_ANSWER, seed=None):
+        self.chat_ttft_ms = chat_ttft_ms
+        self.chat_token_ms = chat_token_ms
+        self.tts_base_ms = tts_base_ms
+        self.tts_ms_per_char = tts_ms_per_char
+        self.stt_base_ms = stt_base_ms
+        self.stt_ms_per_kb = stt_ms_per_kb
+        self.error_rate = error_rate
+        self.answer = answer
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {}
+
+    def count(self, endpoint):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+
+# Function to split the answer into token-sized pieces (words with their spacing)
+def tokenize(text):
+    pieces = []
+    word = ""
+    for char in text:
+        word += char
+        if char in " \n":
+            pieces.append(word)
+            word = ""
+    if word:
+        pieces.append(word)
+    return pieces
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Implements the chat-completions, audio-speech and audio-transcriptions endpoints."""
+
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        path = self.path.split("?")[0]
+        if path.endswith("/chat/completions"):
+            endpoint = "chat"
+        elif path.endswith("/audio/speech"):
+            endpoint = "speech"
+        elif path.endswith("/audio/transcriptions"):
+            endpoint = "transcription"
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {path}"}})
+            return
+
+        self.config.count(endpoint)
+        if self.config.should_fail():
+            # Alternate between a rate limit and a server error
+            if self.config.random.random() < 0.5:
+                self.send_json(429, {"error": {"message": "Rate limit reached"}}, {"Retry-After": "0.1"})
+            else:
+                self.send_json(500, {"error": {"message": "Internal error"}})
+            return
+
+        getattr(self, "handle_" + endpoint)(body)
+
+    def handle_chat(self, body):
+        request = json.loads(body)
+        prompt_chars = sum(len(m["content"]) for m in request["messages"])
+        tokens = tokenize(self.config.answer)
+        usage = {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_chars // 4 + len(tokens),
+        }
+        base = {"id": "chatcmpl-" + uuid.uuid4().hex[:12], "created": int(time.time()), "model": request["model"]}
+
+        time.sleep(self.config.chat_ttft_ms / 1000)
+        if not request.get("stream"):
+            time.sleep(self.config.chat_token_ms * len(tokens) / 1000)
+            self.send_json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self.config.answer},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(self.config.chat_token_ms / 1000)
+                send_event(json.dumps({
+                    **base,
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }))
+            send_event(json.dumps({
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }))
+            if (request.get("stream_options") or {}).get("include_usage"):
+                send_event(json.dumps({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}))
+            send_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early
+            self.close_connection = True
+
+    def handle_speech(self, body):
+        request = json.loads(body)
+        text = request["input"]
+        time.sleep((self.config.tts_base_ms + self.config.tts_ms_per_char * len(text)) / 1000)
+        # Roughly the size of 64 kbps MP3 at 15 characters per second of speech
+        audio = b"\xff\xfb" + bytes(max(len(text) * 500, 64))
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Content-Length", str(len(audio)))
+        self.end_headers()
+        self.wfile.write(audio)
+
+    def handle_transcription(self, body):
+        time.sleep((self.config.stt_base_ms + self.config.stt_ms_per_kb * len(body) / 1024) / 1000)
+        self.send_json(200, {"text": "What are the top 3 recommended store locations in Giza?"})
+
+
+class FakeOpenAIServer:
+    """Local stand-in for the OpenAI API, run on a background thread."""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or FakeOpenAIConfig()
+        handler = type("Handler", (FakeOpenAIHandler,), {"config": self.config})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fake-openai", daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a local fake OpenAI server")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--chat-ttft-ms", type=float, default=400)
+    parser.add_argument("--chat-token-ms", type=float, default=15)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        FakeOpenAIConfig(chat_ttft_ms=args.chat_ttft_ms, chat_token_ms=args.chat_token_ms, error_rate=args.error_rate),
+        port=args.port,
+    ).start()
+    print(f"Fake OpenAI server on {server.base_url}, set OPENAI_BASE_URL to use it")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,194 @@
+import socketserver
+import threading
+import time
+
+
+class FakeRedisData:
+    """In-memory keyspace with the handful of commands the session store uses."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.expires = {}
+
+    # Function to drop a key whose TTL has passed, checked lazily on access
+    def _alive(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and time.monotonic() >= deadline:
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.values
+
+    def _typed(self, key, kind):
+        if not self._alive(key):
+            return None
+        value = self.values[key]
+        if not isinstance(value, kind):
+            raise TypeError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def execute(self, name, args):
+        with self.lock:
+            handler = getattr(self, "cmd_" + name.lower(), None)
+            if handler is None:
+                raise TypeError(f"ERR unknown command '{name}'")
+            return handler(*args)
+
+    def cmd_ping(self, *args):
+        return "PONG"
+
+    def cmd_auth(self, *args):
+        return "OK"
+
+    def cmd_select(self, db):
+        return "OK"
+
+    def cmd_rpush(self, key, *items):
+        values = self._typed(key, list)
+        if values is None:
+            values = self.values[key] = []
+        values.extend(items)
+        return len(values)
+
+    def cmd_lpop(self, key):
+        values = self._typed(key, list)
+        if not values:
+            return None
+        item = values.pop(0)
+        if not values:
+            del self.values[key]
+        return item
+
+    def cmd_ltrim(self, key, start, stop):
+        values = self._typed(key, list)
+        if values is not None:
+            values[:] = self.cmd_lrange(key, start, stop)
+            if not values:
+                del self.values[key]
+        return "OK"
+
+    def cmd_lrange(self, key, start, stop):
+        values = self._typed(key, list) or []
+        start, stop = int(start), int(stop)
+        stop = len(values) + stop if stop < 0 else stop
+        return values[start:stop + 1]
+
+    def cmd_hset(self, key, *pairs):
+        values = self._typed(key, dict)
+        if values is None:
+            values = self.values[key] = {}
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in values
+            values[field] = value
+        return added
+
+    def cmd_hincrby(self, key, field, amount):
+        values = self._typed(key, dict)
+        if values is None:
+            values = self.values[key] = {}
+        values[field] = str(int(values.get(field, b"0")) + int(amount)).encode()
+        return int(values[field])
+
+    def cmd_hgetall(self, key):
+        values = self._typed(key, dict) or {}
+        return [item for pair in values.items() for item in pair]
+
+    def cmd_expire(self, key, seconds):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + int(seconds)
+        return 1
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                del self.values[key]
+                self.expires.pop(key, None)
+                removed += 1
+        return removed
+
+
+# Function to encode a reply in the Redis protocol
+def encode_reply(value):
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool) or isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+" + value.encode() + b"\r\n"
+    if isinstance(value, Exception):
+        return b"-" + str(value.args[0]).encode() + b"\r\n"
+    if isinstance(value, (list, tuple)):
+        return b"*%d\r\n" % len(value) + b"".join(encode_reply(item) for item in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Reads RESP command arrays and answers them one by one."""
+
+    data = None
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command, e.g. "PING" typed into telnet
+            return line.split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        while True:
+            command = self.read_command()
+            if not command:
+                return
+            try:
+                reply = self.data.execute(command[0].decode(), command[1:])
+            except (TypeError, ValueError) as e:
+                reply = e
+            self.wfile.write(encode_reply(reply))
+
+
+class FakeRedisServer:
+    """Local stand-in for a Redis server, run on a background thread."""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.data = FakeRedisData()
+        handler = type("Handler", (FakeRedisHandler,), {"data": self.data})
+        self.server = socketserver.ThreadingTCPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-redis", daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a local fake Redis server")
+    parser.add_argument("--port", type=int, default=6399)
+    args = parser.parse_args()
+
+    server = FakeRedisServer(port=args.port).start()
+    print(f"Fake Redis server on {server.url}, set Config.session_redis_url to use it")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.shutdown()
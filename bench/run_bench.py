@@ -0,0 +1,245 @@
+"""
+Offline benchmark and load test for the voice consultant pipeline.
+
+Starts the local fake OpenAI server, then runs N concurrent simulated
+sessions through the same code the app uses: voice transcription, the
+streaming answer with sentence-by-sentence TTS, and the batch path
+(get_answer, split_text_for_tts and ordered chunk synthesis).
+
+    python bench/run_bench.py --sessions 1 4 8 --turns 3
+    python bench/run_bench.py --save-baseline
+
+Results are compared against bench/baseline.json; the exit code is 1 when a
+metric regresses by more than --tolerance.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Metrics where higher is better; every other metric is a latency
+HIGHER_IS_BETTER = {"throughput_turns_per_s"}
+
+QUESTIONS = [
+    "What are the top 3 recommended store locations in Giza?",
+    "Which of them has the lowest Vodafone market share?",
+    "Where should we put billboards for our ADSL campaign?",
+    "Why did our cross-net market share drop?",
+]
+
+
+# Function to build a recording like mic_recorder's: 48 kHz stereo 16-bit WAV with silence around speech
+def synthetic_recording(seconds_speech=2.0, seconds_silence=0.75, rate=48000):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(rate * seconds_speech)) / rate
+    speech = 0.3 * np.sin(2 * np.pi * 220 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))
+    silence = rng.normal(0, 0.001, int(rate * seconds_silence))
+    mono = np.concatenate([silence, speech, silence])
+    stereo = np.stack([mono, mono], axis=1)
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes((stereo * 32767).astype("<i2").tobytes())
+    return out.getvalue()
+
+
+# Function to compute a nearest-rank percentile
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+# Function to run one streaming turn: transcribe, stream the answer, synthesize sentences
+def streaming_turn(assistant, recording, history, memory):
+    started = time.perf_counter()
+    question, _ = assistant.transcribe_recording(recording)
+    stt_done = time.perf_counter()
+
+    answer = ""
+    first_token = first_audio = None
+    errors = 0
+    for kind, value in assistant.answer_with_speech(question, history, memory):
+        now = time.perf_counter()
+        if kind == "token":
+            first_token = first_token or now
+            answer += value
+        elif kind == "audio":
+            first_audio = first_audio or now
+        else:
+            errors += 1
+    finished = time.perf_counter()
+
+    history.append({"role": "user", "content": question})
+    history.append({"role": "assistant", "content": answer})
+    return {
+        "turn_ms": (finished - started) * 1000,
+        "stt_ms": (stt_done - started) * 1000,
+        "first_token_ms": ((first_token or finished) - started) * 1000,
+        "first_audio_ms": ((first_audio or finished) - started) * 1000,
+        "errors": errors + ("⚠️ Error" in answer),
+    }
+
+
+# Function to run one batch turn: full answer first, then every chunk synthesized in order
+def batch_turn(assistant, question, history, memory):
+    started = time.perf_counter()
+    answer = assistant.get_answer(question, history, memory)
+    first_audio = None
+    errors = int(answer.startswith("⚠️ Error"))
+    chunks = [chunk for chunk in assistant.split_text_for_tts(answer) if chunk.strip()]
+    for _, audio_bytes, error in assistant.get_synthesizer().synthesize_in_order(chunks):
+        if error is not None:
+            errors += 1
+        else:
+            first_audio = first_audio or time.perf_counter()
+    finished = time.perf_counter()
+
+    history.append({"role": "user", "content": question})
+    history.append({"role": "assistant", "content": answer})
+    return {
+        "turn_ms": (finished - started) * 1000,
+        "first_audio_ms": ((first_audio or finished) - started) * 1000,
+        "errors": errors,
+    }
+
+
+# Function to run N concurrent sessions of T turns each and summarize the results
+def run_scenario(assistant, mode, sessions, turns, recording):
+    from history import ConversationMemory
+
+    results = []
+    lock = threading.Lock()
+
+    def session(index):
+        history = []
+        memory = ConversationMemory()
+        for turn in range(turns):
+            if mode == "stream":
+                result = streaming_turn(assistant, recording, history, memory)
+            else:
+                question = QUESTIONS[(index + turn) % len(QUESTIONS)]
+                result = batch_turn(assistant, question, history, memory)
+            with lock:
+                results.append(result)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(session, range(sessions)))
+    wall = time.perf_counter() - started
+
+    turn_ms = [r["turn_ms"] for r in results]
+    first_audio_ms = [r["first_audio_ms"] for r in results]
+    summary = {
+        "turn_p50_ms": percentile(turn_ms, 50),
+        "turn_p95_ms": percentile(turn_ms, 95),
+        "first_audio_p50_ms": percentile(first_audio_ms, 50),
+        "first_audio_p95_ms": percentile(first_audio_ms, 95),
+        "throughput_turns_per_s": len(results) / wall,
+        "errors": sum(r["errors"] for r in results),
+    }
+    if mode == "stream":
+        summary["first_token_p50_ms"] = percentile([r["first_token_ms"] for r in results], 50)
+        summary["stt_p50_ms"] = percentile([r["stt_ms"] for r in results], 50)
+    return {name: round(value, 2) if isinstance(value, float) else value for name, value in summary.items()}
+
+
+# Function to list the metrics that got worse than the baseline by more than the tolerance
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for scenario, metrics in results.items():
+        for name, value in metrics.items():
+            reference = baseline.get(scenario, {}).get(name)
+            if reference in (None, 0) or value is None or name == "errors":
+                continue
+            if name in HIGHER_IS_BETTER:
+                worse = value < reference * (1 - tolerance)
+            else:
+                worse = value > reference * (1 + tolerance)
+            if worse:
+                regressions.append(f"{scenario} {name}: {value} vs baseline {reference}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 8], help="Concurrent sessions per scenario")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per session")
+    parser.add_argument("--modes", nargs="+", default=["stream", "batch"], choices=["stream", "batch"])
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake API calls that fail")
+    parser.add_argument("--chat-ttft-ms", type=float, default=400)
+    parser.add_argument("--chat-token-ms", type=float, default=15)
+    parser.add_argument("--tts-base-ms", type=float, default=250)
+    parser.add_argument("--stt-base-ms", type=float, default=300)
+    parser.add_argument("--save-baseline", action="store_true", help=f"Write results to {BASELINE_PATH}")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(FakeOpenAIConfig(
+        chat_ttft_ms=args.chat_ttft_ms,
+        chat_token_ms=args.chat_token_ms,
+        tts_base_ms=args.tts_base_ms,
+        stt_base_ms=args.stt_base_ms,
+        error_rate=args.error_rate,
+        seed=0,
+    )).start()
+    os.environ["OPENAI_API_KEY"] = "bench"
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+
+    # Measure the pipeline itself: no caches, no metrics log
+    from config import Config
+    Config.answer_cache_enabled = False
+    Config.tts_cache_enabled = False
+    Config.metrics_log_path = None
+    import assistant
+
+    recording = synthetic_recording()
+    results = {}
+    for mode in args.modes:
+        for sessions in args.sessions:
+            scenario = f"{mode}/sessions={sessions}"
+            results[scenario] = run_scenario(assistant, mode, sessions, args.turns, recording)
+            print(scenario, json.dumps(results[scenario]))
+    print("fake API requests:", json.dumps(server.config.requests))
+    server.shutdown()
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline saved to {BASELINE_PATH}")
+        return 0
+
+    if not os.path.exists(BASELINE_PATH):
+        print("No baseline yet, run with --save-baseline")
+        return 0
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION", regression)
+    if not regressions:
+        print(f"No regressions beyond {args.tolerance:.0%} of the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import threading
+import metrics
+
+
+class CancelToken:
+    """
+    Cancellation state of one turn. Work started for the turn registers a
+    callback (close the chat stream, cancel queued TTS requests) that runs
+    once when the turn is cancelled, from whichever thread cancels it.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self.reason = None
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    # Function to register cleanup for the turn, run at once if it is already cancelled
+    def on_cancel(self, callback):
+        with self.lock:
+            if not self.cancelled:
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    # Function to cancel the turn, returns False when it was already cancelled
+    def cancel(self, reason="cancelled"):
+        with self.lock:
+            if self.cancelled:
+                return False
+            self.cancelled = True
+            self.reason = reason
+            callbacks, self.callbacks = self.callbacks, []
+        metrics.registry.incr("turns_cancelled")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+        return True
+
+
+class TurnRegistry:
+    """The running turn of each session; starting a new turn cancels the previous one."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}
+
+    # Function to begin a turn for a session, barging in on the one still running
+    def start(self, session_id):
+        token = CancelToken()
+        with self.lock:
+            previous = self.active.get(session_id)
+            self.active[session_id] = token
+        if previous is not None:
+            previous.cancel("barge-in")
+        return token
+
+    def finish(self, session_id, token):
+        with self.lock:
+            if self.active.get(session_id) is token:
+                del self.active[session_id]
+
+    # Function to cancel a session's running turn without starting a new one
+    def cancel(self, session_id, reason="cancelled"):
+        with self.lock:
+            token = self.active.pop(session_id, None)
+        return token is not None and token.cancel(reason)
+
+
+turns = TurnRegistry()
@@ -4,12 +4,146 @@ class Config:
     temperature=0.0
     port = 8000
 
-    prompt = """You are a **Vodafone AI Consultant** with access to internal data, recommendation models, and performance analytics.  
+    # Shared OpenAI client. base_url (or OPENAI_BASE_URL) can point at a local
+    # stand-in server. Timeouts are in seconds per call type; retries use
+    # jittered exponential backoff or the server's Retry-After.
+    openai_base_url = None
+    openai_timeouts = {"chat": 60, "transcription": 30, "speech": 30}
+    openai_max_retries = 3
+    openai_retry_backoff = 0.5
+    openai_max_backoff = 8
+    # Keep-alive connection pool
+    openai_max_connections = 32
+    openai_max_keepalive = 16
+    openai_keepalive_expiry = 60
+    # Process-wide backpressure: concurrent requests per call type and the
+    # chat token rate (0 disables it)
+    openai_max_concurrency = {"chat": 8, "transcription": 4, "speech": 8}
+    openai_tokens_per_minute = 60000
+    openai_expected_completion_tokens = 500
+
+    # Streaming answers: tokens are rendered live and every finished
+    # sentence is sent to TTS while the model is still generating
+    stream_answers = True
+    tts_model = "tts-1"
+    tts_voice = "alloy"
+    # TTS codec: "mp3", or "opus"/"aac" for fewer bytes per answer
+    # (Ogg Opus needs a recent Safari on Apple devices)
+    tts_format = "mp3"
+    # Sentences shorter than this are merged with the next one so we do not
+    # pay a TTS round trip for fragments like "1." or "Sure!"
+    tts_min_sentence_chars = 40
+    # Batch answers are spoken in chunks that start small for fast first audio
+    # and grow by tts_chunk_growth per chunk, up to the API's input limit
+    tts_first_chunk_chars = 200
+    tts_chunk_growth = 3
+    tts_max_chunk_chars = 4000
+    # Parallel TTS synthesis: process-wide cap on concurrent speech requests
+    tts_max_concurrency = 4
+    # A new question cancels the answer still being generated for the same
+    # session. Keep what was generated so far in the history, or drop the turn.
+    keep_partial_answers = True
+    # Audio is served by URL instead of base64 data URIs, from Streamlit's own
+    # media endpoint so it works on any deployment. The local media server
+    # exports /metrics; audio and the barge-in /cancel beacon use it only when
+    # media_base_url is set to an address the browser can reach, e.g. behind
+    # the app's HTTPS proxy.
+    media_server_enabled = True
+    media_host = "0.0.0.0"
+    media_port = 8502
+    media_base_url = None
+    media_store_max_bytes = 100 * 1024 * 1024
+    # Headless API (api_server.py) on Config.port for kiosk and IVR clients.
+    # Blocking OpenAI calls run on a pool of api_workers threads; idle
+    # sessions are dropped after api_session_ttl seconds.
+    api_host = "0.0.0.0"
+    api_workers = 16
+    api_session_ttl = 60 * 60
+    api_max_body_bytes = 10 * 1024 * 1024
+    # Browser origins allowed to open the /ws socket besides the API's own host,
+    # e.g. "https://kiosk.example.com"; clients without an Origin header are not checked
+    api_allowed_origins = []
+    # Persistent TTS audio cache shared by every session and process on this host
+    tts_cache_enabled = True
+    tts_cache_path = ".cache/tts_cache.sqlite3"
+    tts_cache_max_bytes = 200 * 1024 * 1024
+
+    # Persistent answer cache, entries expire after the TTL in seconds
+    answer_cache_enabled = True
+    answer_cache_path = ".cache/answer_cache.sqlite3"
+    answer_cache_ttl = 7 * 24 * 60 * 60
+    # Optionally answer these known questions at startup to fill the cache
+    answer_cache_prewarm = False
+    prewarm_questions = [
+        "What are the top recommended locations for new retail stores?",
+        "Where should we place billboards for our fixed/ADSL campaign?",
+        "Why did our cross-net market share drop?",
+    ]
+
+    # Intent-routed prompt assembly: only the sections a question needs are
+    # sent, the whole prompt is used when the classifier score is too low
+    prompt_routing = True
+    intent_min_score = 2
+
+    # Model outputs injected into the prompt (CSV, or Parquet with pandas installed).
+    # Files are reloaded when they change, no redeploy needed.
+    retail_data_path = "data/retail_recommendations.csv"
+    billboard_data_path = "data/billboard_impressions.csv"
+    # Vodafone acquisition share below this is flagged as low market share
+    low_market_share = 0.45
+    # Locations returned for a "lat, lon" nearest-location lookup
+    retail_nearest_k = 3
+
+    # Voice input pre-processing before Whisper: energy-based silence trimming,
+    # downmix and resample to 16 kHz mono, re-encode as "mulaw" (8-bit G.711
+    # WAV, half the size) or "pcm16"
+    stt_preprocess = True
+    stt_sample_rate = 16000
+    stt_encoding = "mulaw"
+    vad_floor_db = -50
+    vad_margin_db = 10
+    vad_padding_ms = 200
+    # Per-utterance upload stats kept in the session
+    stt_stats_history = 50
+
+    # Per-turn latency instrumentation: JSONL log of every turn (None disables
+    # it), Prometheus text at /metrics on the media server, sidebar panel
+    metrics_log_path = ".cache/turn_metrics.jsonl"
+    # The log is rotated at this size, keeping metrics_log_backups older files
+    metrics_log_max_bytes = 10 * 1024 * 1024
+    metrics_log_backups = 3
+    metrics_recent_turns = 10
+    metrics_sidebar = True
+
+    # Conversation history: recent messages are sent verbatim up to this many
+    # tokens, older ones are folded into a running summary
+    history_token_budget = 1500
+    # Messages kept for display and storage; only turns already in the summary
+    # are dropped to stay under it
+    history_max_messages = 40
+    summary_model = "gpt-3.5-turbo"
+    summary_max_tokens = 300
+
+    # Conversations are saved turn by turn so any worker can continue them and
+    # they survive restarts: "sqlite" (one host), "redis" (session_redis_url)
+    # or None to keep them in the Streamlit session only. A session keeps at
+    # most session_max_bytes of compressed messages and expires session_ttl
+    # seconds after its last turn.
+    session_store = "sqlite"
+    session_store_path = ".cache/sessions.sqlite3"
+    session_redis_url = "redis://localhost:6379/0"
+    session_ttl = 7 * 24 * 60 * 60
+    session_max_bytes = 256 * 1024
+
+    # The system prompt is kept in named sections so prompt_builder can send only
+    # the ones a question needs; prompt_builder.assemble_prompt() joins them and
+    # adds the model output data from retail_data_path and billboard_data_path.
+    prompt_intro = """You are a **Vodafone AI Consultant** with access to internal data, recommendation models, and performance analytics.  
 Your job is to provide **professional, clear, and actionable answers** based on the provided model output or context.
 You can assume any missing data but do not state that this is an assumption to the user.
-You should use icons in your answer to be more engaging.
----
+You should use icons in your answer to be more engaging."""
 
+    prompt_retail = """
 ### 🏪 Retail Expansion Use Case
 
 If the question is about **retail store expansion**, follow this structure:
@@ -34,9 +168,9 @@ If the question is about **retail store expansion**, follow this structure:
     - ORG = Orange
     - WE = Telecom Egypt (WE)
 - Do not output percentage as this 0.45 instead make it 45% 
+"""
 
----
-
+    prompt_billboard = """
 ### 📍 Billboard Location Recommendation for Fixed/ADSL Campaign Targeting
 
 If the question is about **fixed/ADSL marketing**, first ask for the persona of the targeted users exmamples as following:
@@ -53,9 +187,9 @@ when provided by targeted audience and after you answer the question put the lin
 
 **Dashboard Link**:  
 [Dashboard filtered based on your criteria](https://spotfire-web/spotfire/wp/analysis?file=/Data%20Science/Marcom/Marcom%20-%20Autov_review2&waid=U-3FSq6OKEqOpNjpHS9oz-2006388a69Oj4b&wavid=0)
+"""
 
----
-
+    prompt_cvm = """
 ### CVM Drop in Cross-Net Market share
 
 If the question is about a drop in cross-net market share, follow this format and tone:
@@ -82,9 +216,9 @@ Structure your answer with:
 Analysis output : 200K users dropped in cross-net usage this month, you should communicate this as insight got from your analysis.
 Make your answer sound like a conversation with commercial managers and CVM owners.
 
+"""
 
----
-
+    prompt_other = """
 ### ❓ Other Questions
 
 If the question is unrelated to:
@@ -96,45 +230,6 @@ If the question is unrelated to:
 You may answer based on your internal knowledge as a Vodafone AI Consultant.  
 Use professional and business-friendly reasoning.  
 Avoid retail model outputs unless relevant.
-
----
-
-### 📊 Model Output for Retail Expansion
-
-```csv
-|    | governorate   | qism                            | sheyakha                      |   vodafone_acquistion_marketshare_montly |   max_competitor_market_share | competitor_name_has_maximum_marketshare_excludinng_vf   |   median_distance_to_nearest_store |   store_id_of_the_nearest_Store | store_name_of_the_nearest_Store          |   Rank |   recommended_latitude |   recommended_longitude | google_maps_link                              | attraction_index   | population     | visitors_per_terminal   |   competitor_Etisalat |   competitor_Orange |   competitor_WE |
-|---:|:--------------|:--------------------------------|:------------------------------|-----------------------------------------:|------------------------------:|:--------------------------------------------------------|-----------------------------------:|--------------------------------:|:-----------------------------------------|-------:|-----------------------:|------------------------:|:----------------------------------------------|:-------------------|:---------------|:------------------------|----------------------:|--------------------:|----------------:|
-|  0 | CAIRO         | QAIRO  AL GEDIDA 3 th  KISM     | El Qatamia                    |                                 0.341576 |                      0.318788 | ET                                                      |                            3.96814 |                             920 | Hamd Plaza Mall Express Store            |      1 |                29.977  |                 31.391  | https://www.google.com/maps?q=29.977,31.391   | Extremely High     | Extremely High | Extremely High          |                     0 |                   0 |               0 |
-|  1 | AL SHARKIA    | 2 nd 10th  OF  RAMMADAN KISM    | 2nd 10 Of Rammadan            |                                 0.443007 |                      0.238059 | ORG                                                     |                            4.92369 |                             928 | 10th of Ramadan Andalus St Express Store |      2 |                30.3388 |                 31.776  | https://www.google.com/maps?q=30.3388,31.776  | Extremely High     | Extremely High | Extremely High          |                     0 |                   0 |               0 |
-|  2 | AL GHARBIA    | AL MAHALA  EL  KOBRA 2 nd  KISM | Imam El Husseiny              |                                 0.417684 |                      0.318451 | ORG                                                     |                            1.47016 |                             895 | Mahalla Shoun Sq. Express Store          |      3 |                30.9554 |                 31.153  | https://www.google.com/maps?q=30.9554,31.153  | Extremely High     | Extremely High | High                    |                     1 |                   2 |               1 |
-|  3 | CAIRO         | AL SHOROK KISM                  | el sherouk1                   |                                 0.369456 |                      0.291478 | ET                                                      |                            3.81748 |                             577 | Sky Plaza Store                          |      4 |                30.1644 |                 31.5566 | https://www.google.com/maps?q=30.1644,31.5566 | Extremely High     | Extremely High | High                    |                     0 |                   0 |               0 |
-|  4 | AL GIZA       | 3 th 6OCTOBER KISM              | AL SHYKH AL KHMSA             |                                 0.348446 |                      0.353465 | ET                                                      |                            2.72479 |                             595 | Mall of Egypt Store                      |      5 |                29.9579 |                 31.0546 | https://www.google.com/maps?q=29.9579,31.0546 | Extremely High     | Extremely High | Extremely High          |                     0 |                   1 |               0 |
-|  5 | CAIRO         | 2 nd  QAIRO  AL GEDIDA KISM     | Academet Al Shorta &Mirag     |                                 0.397674 |                      0.290938 | ET                                                      |                            2.04682 |                            8002 | Tagamoa Elsouq St Express Store          |      6 |                30.0776 |                 31.4373 | https://www.google.com/maps?q=30.0776,31.4373 | Extremely High     | Extremely High | High                    |                     1 |                   2 |               1 |
-|  6 | CAIRO         | 1 St  QAIRO  AL GEDIDA KISM     | El Gamaa El Amrekia & El Rwda |                                 0.392185 |                      0.287739 | ET                                                      |                            3.18884 |                             911 | Point 90 Mall Express Store              |      7 |                30.0143 |                 31.5313 | https://www.google.com/maps?q=30.0143,31.5313 | Extremely High     | Extremely High | High                    |                     1 |                   1 |               0 |
-|  7 | CAIRO         | MOKATAM KISM                    | El Sabeen Fadan               |                                 0.349357 |                      0.343177 | ET                                                      |                            1.60974 |                             316 | MaadiCityCenter                          |      8 |                29.9815 |                 31.3614 | https://www.google.com/maps?q=29.9815,31.3614 | Extremely High     | Extremely High | High                    |                     0 |                   1 |               1 |
-|  8 | CAIRO         | TORA KISM                       | Tora El Heet                  |                                 0.331785 |                      0.325709 | ET                                                      |                            2.74331 |                             752 | Maadi Degla Express Store                |      9 |                29.9342 |                 31.2864 | https://www.google.com/maps?q=29.9342,31.2864 | Extremely High     | Extremely High | High                    |                     0 |                   2 |               1 |
-|  9 | AL SHARKIA    | AL ZAKAZIK  MARKAS              | Bardein                       |                                 0.42872  |                      0.329803 | ORG                                                     |                            9.26613 |                            1613 | Zakazik ElZeraa Express Store            |     10 |                30.5136 |                 31.5348 | https://www.google.com/maps?q=30.5136,31.5348 | High               | Extremely High | Extremely High          |                     0 |                   0 |               0 |
-| 10 | ALEXANDRIA    | 2 nd  AL AMARIA  KISM           | NAGA  AL OMDA HNDWI           |                                 0.334628 |                      0.41455  | ORG                                                     |                            8.07137 |                            7006 | Ameraya Koubry Express Store             |     11 |                30.8145 |                 29.9263 | https://www.google.com/maps?q=30.8145,29.9263 | Extremely High     | Extremely High | Extremely High          |                     0 |                   0 |               1 |
-| 11 | AL GIZA       | MONSHAT ELKANATER MARKAS        | Monshaet El Qanater City      |                                 0.299187 |                      0.312922 | ET                                                      |                            2.34635 |                            1625 | El qanater elkhayraya Express            |     12 |                30.1829 |                 31.1147 | https://www.google.com/maps?q=30.1829,31.1147 | High               | Extremely High | Extremely High          |                     1 |                   0 |               0 |
-| 12 | AL GIZA       | 1 St 6OCTOBER KISM              | El Hay El Talta               |                                 0.397151 |                      0.30218  | ET                                                      |                            1.50494 |                             432 | Six October                              |     13 |                29.964  |                 30.9361 | https://www.google.com/maps?q=29.964,30.9361  | Extremely High     | Extremely High | Mid                     |                     1 |                   0 |               0 |
-| 13 | CAIRO         | AL TBEEN KISM                   | El Tebin El Qebleya           |                                 0.273961 |                      0.48855  | ET                                                      |                            8.30029 |                            1556 | Helwan Atlas Express Store               |     14 |                29.7765 |                 31.2953 | https://www.google.com/maps?q=29.7765,31.2953 | Low                | Low            | Extremely High          |                     0 |                   0 |               0 |
-| 14 | ASSIOUT       | SADFA  MARKAS                   | Sadfa City                    |                                 0.213483 |                      0.346586 | ET                                                      |                            4.11592 |                             986 | Assiut ElBadary Express Store            |     15 |                26.967  |                 31.3852 | https://www.google.com/maps?q=26.967,31.3852  | High               | Extremely High | Extremely High          |                     0 |                   0 |               0 |
-| 15 | AL GHARBIA    | TANTA   MARKAS                  | Shubra El Namlah              |                                 0.413822 |                      0.311053 | ORG                                                     |                            6.00157 |                             872 | Tanta Nahhas St. Express Store           |     16 |                30.7989 |                 30.9317 | https://www.google.com/maps?q=30.7989,30.9317 | Extremely High     | Extremely High | High                    |                     0 |                   0 |               0 |
-| 16 | AL ISMALIA    | 3 th  KISM                      | El Shaikh Zaid                |                                 0.40587  |                      0.374241 | ORG                                                     |                            2.07117 |                             325 | Ismaelia                                 |     17 |                30.6067 |                 32.2998 | https://www.google.com/maps?q=30.6067,32.2998 | Extremely High     | Extremely High | Extremely High          |                     0 |                   3 |               0 |
-| 17 | CAIRO         | AL MASARA KISM                  | El Masara El Mahata           |                                 0.317463 |                      0.355522 | ET                                                      |                            1.72867 |                             897 | Hadayek Helwan Express Store             |     18 |                29.9071 |                 31.306  | https://www.google.com/maps?q=29.9071,31.306  | Extremely High     | Extremely High | High                    |                     0 |                   1 |               0 |
-| 18 | ASSIOUT       | ASSIOUT  AL GEDIDA  CITY        | ASYIOT AL GDIDA CITY          |                                 0.324487 |                      0.332931 | ET                                                      |                           11.632   |                            1642 | Assiut ElFath Express Store              |     19 |                27.2724 |                 31.2903 | https://www.google.com/maps?q=27.2724,31.2903 | High               | Extremely High | High                    |                     0 |                   1 |               0 |
-| 19 | ASSIOUT       | ASSIOUT  1 St  KISM             | El Besray                     |                                 0.390625 |                      0.269676 | ET                                                      |                            1.19266 |                            1689 | Assiut 23 July St Express Store          |     20 |                27.1821 |                 31.1615 | https://www.google.com/maps?q=27.1821,31.1615 | High               | Extremely High | High                    |                     0 |                   0 |               0 |
-```
-
----
-
-### 📊 Model Output for BillBoard locatoins:
-Region,Rank,Governorate,Qism,Hourly Impression
-Delta,1,Dakahlia,El Mansoura,3500000
-Delta,2,Dakahlia,Talkha,2500000
-Delta,3,Dakahlia,Shebik Elkum,1100000
-Cairo,4,Cairo,Muski,1000000
-Alexandria,5,Alexandria,Alamreiya,730000
 """
 
 #3. **Cohort Insight**: Identify that these users are Your target users. 
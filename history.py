@@ -0,0 +1,158 @@
+from config import Config
+from openai_client import chat_completion
+from prompt_builder import count_tokens
+
+# Rough per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a Vodafone business user "
+    "and the Vodafone AI Consultant. Update the summary with the new messages. Keep the "
+    "topics asked about, the facts, numbers, locations and audience criteria the user gave, "
+    "and the recommendations made. Be concise, plain text, no emojis."
+)
+
+
+# Function to count the tokens a message takes in the request
+def message_tokens(message):
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+# Function to count the leading messages that can be dropped to shed `excess` in size
+def droppable_prefix(messages, summarized, excess, sizes=None):
+    """
+    Only whole turns (a question and its answer) already folded into the
+    summary are dropped, so what is kept starts with a question and no
+    unsummarized message is lost. Less than `excess` is shed when that is
+    all that qualifies.
+
+    Args:
+        messages (list): Messages, oldest first
+        summarized (int): Number of leading messages folded into the summary
+        excess (int): Size to shed
+        sizes (list): Size of each message, 1 per message by default
+
+    Returns:
+        int: Number of leading messages to drop
+    """
+    drop = 0
+    shed = 0
+    if excess <= 0:
+        return drop
+    for i in range(min(summarized, len(messages))):
+        shed += sizes[i] if sizes is not None else 1
+        if i + 1 == len(messages) or messages[i + 1]["role"] == "user":
+            drop = i + 1
+            if shed >= excess:
+                break
+    return drop
+
+
+class ConversationMemory:
+    """
+    Token-budgeted view of a conversation.
+
+    The most recent messages are kept verbatim up to the token budget; older
+    ones are folded into a running summary. The summary is cached here and
+    only regenerated when new messages fall out of the verbatim window.
+    """
+
+    def __init__(self, token_budget=None, summary="", summarized=0):
+        self.token_budget = token_budget or Config.history_token_budget
+        # Restored from the session store when a conversation is resumed
+        self.summary = summary
+        # Number of leading history messages already folded into the summary
+        self.summarized = summarized
+        # Messages folded since the session store last saved the summary
+        self.newly_summarized = 0
+
+    # Function to find where the verbatim window starts
+    def window_start(self, history):
+        """
+        Nothing is folded while the unsummarized messages fit the budget.
+        Once they overflow, the window shrinks to half the budget so the
+        summary is regenerated every few turns rather than on every turn.
+        """
+        unsummarized = history[self.summarized:]
+        if sum(message_tokens(m) for m in unsummarized) <= self.token_budget:
+            return self.summarized
+
+        used = 0
+        start = len(history)
+        while start > self.summarized:
+            tokens = message_tokens(history[start - 1])
+            if used + tokens > self.token_budget // 2:
+                break
+            used += tokens
+            start -= 1
+        return start
+
+    # Function to drop the oldest summarized turns so the history keeps at most max_messages
+    def trim(self, history, max_messages=None):
+        """
+        The history list is trimmed in place and the summarized count moves
+        with it. Unsummarized messages are never dropped, they are bounded
+        by the token budget instead.
+
+        Returns:
+            int: Number of messages dropped
+        """
+        max_messages = max_messages or Config.history_max_messages
+        drop = droppable_prefix(history, self.summarized, len(history) - max_messages)
+        if drop:
+            del history[:drop]
+            self.summarized -= drop
+        return drop
+
+    # Function to take the number of messages folded into the summary since the last save
+    def pop_newly_summarized(self):
+        count, self.newly_summarized = self.newly_summarized, 0
+        return count
+
+    # Function to build the history messages to send for the next question
+    def context(self, history, summarize):
+        """
+        Args:
+            history (list): Every previous message of the conversation, oldest first
+            summarize (callable): summarize(previous_summary, messages) -> new summary
+
+        Returns:
+            list: A summary system message (when there is one) followed by the recent messages
+        """
+        start = self.window_start(history)
+        if start > self.summarized:
+            self.summary = summarize(self.summary, history[self.summarized:start])
+            self.newly_summarized += start - self.summarized
+            self.summarized = start
+
+        messages = []
+        if self.summary:
+            messages.append({
+                "role": "system",
+                "content": "Summary of the earlier conversation:\n" + self.summary,
+            })
+        messages.extend(history[start:])
+        return messages
+
+
+# Function to fold messages into the running summary with the chat model
+def summarize_history(previous_summary, messages):
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    try:
+        response = chat_completion(
+            model=Config.summary_model,
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": (
+                    f"Current summary:\n{previous_summary or '(empty)'}\n\n"
+                    f"New messages:\n{transcript}"
+                )},
+            ],
+            temperature=0.0,
+            max_tokens=Config.summary_max_tokens,
+        )
+        return response.choices[0].message.content.strip()
+    except Exception:
+        # Keep going without the model: append a clipped transcript
+        clipped = "\n".join(f"{m['role']}: {m['content'][:200]}" for m in messages)
+        return (previous_summary + "\n" + clipped).strip()
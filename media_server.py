@@ -0,0 +1,164 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from config import Config
+
+# MIME type of each TTS response format
+AUDIO_MIME_TYPES = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+    "aac": "audio/aac",
+    "wav": "audio/wav",
+}
+
+
+class MediaStore:
+    """In-memory, byte-bounded LRU store of audio chunks addressed by content hash."""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or Config.media_store_max_bytes
+        self.items = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    # Function to store a chunk and return its id, identical audio shares one id
+    def add(self, data, mimetype):
+        media_id = hashlib.sha256(data).hexdigest()[:32]
+        with self.lock:
+            if media_id in self.items:
+                self.items.move_to_end(media_id)
+                return media_id
+            self.items[media_id] = (data, mimetype)
+            self.size += len(data)
+            while self.size > self.max_bytes and len(self.items) > 1:
+                _, (old, _) = self.items.popitem(last=False)
+                self.size -= len(old)
+        return media_id
+
+    def get(self, media_id):
+        with self.lock:
+            item = self.items.get(media_id)
+            if item is not None:
+                self.items.move_to_end(media_id)
+            return item
+
+
+# Function to parse a single "bytes=" Range header, returns (start, end) or None when unsatisfiable
+def parse_range(header, length):
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(length - int(last), 0), length - 1
+    else:
+        start = int(first)
+        end = min(int(last), length - 1) if last else length - 1
+    if start > end or start >= length:
+        return None
+    return start, end
+
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves /media/<id> with range request support so browsers can stream and
+    seek, plus any extra text routes such as /metrics. A route's render
+    function gets the parsed query string.
+    """
+
+    store = None
+    routes = {}
+
+    def do_GET(self):
+        self.dispatch(with_body=True)
+
+    def do_HEAD(self):
+        self.dispatch(with_body=False)
+
+    # Routes also accept POST, e.g. navigator.sendBeacon from the page
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.dispatch(with_body=True)
+
+    def dispatch(self, with_body):
+        url = urlsplit(self.path)
+        route = self.routes.get(url.path)
+        if route is None:
+            self.send_media(with_body)
+            return
+        content_type, render = route
+        body = render(parse_qs(url.query)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if with_body:
+            self.wfile.write(body)
+
+    def send_media(self, with_body):
+        match = re.fullmatch(r"/media/([0-9a-f]+)(\.\w+)?", self.path.split("?")[0])
+        item = self.store.get(match.group(1)) if match else None
+        if item is None:
+            self.send_error(404)
+            return
+
+        data, mimetype = item
+        length = len(data)
+        start, end = 0, length - 1
+        status = 200
+        if "Range" in self.headers:
+            byte_range = parse_range(self.headers["Range"], length)
+            if byte_range is None:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{length}")
+                self.end_headers()
+                return
+            start, end = byte_range
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", mimetype)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{length}")
+        self.send_header("Cache-Control", "public, max-age=86400, immutable")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        if with_body:
+            self.wfile.write(data[start:end + 1])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MediaServer:
+    """
+    Local HTTP endpoint for synthesized audio.
+
+    Chunks are published here and the browser fetches them by URL instead of
+    receiving base64 data URIs over the Streamlit websocket, so each chunk
+    can start playing as soon as it is published.
+    """
+
+    def __init__(self, host=None, port=None, base_url=None, store=None, routes=None):
+        self.store = store or MediaStore()
+        handler = type("Handler", (MediaRequestHandler,), {"store": self.store, "routes": routes or {}})
+        port = port if port is not None else Config.media_port
+        self.httpd = ThreadingHTTPServer((host or Config.media_host, port), handler)
+        self.httpd.daemon_threads = True
+        self.base_url = (base_url or Config.media_base_url or f"http://localhost:{self.httpd.server_port}").rstrip("/")
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="media-server", daemon=True)
+        self.thread.start()
+
+    # Function to publish a chunk and return the URL the browser should load
+    def publish(self, data, audio_format="mp3"):
+        media_id = self.store.add(data, AUDIO_MIME_TYPES.get(audio_format, "application/octet-stream"))
+        return f"{self.base_url}/media/{media_id}.{audio_format}"
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
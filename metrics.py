@@ -0,0 +1,252 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from config import Config
+
+
+class TurnTrace:
+    """
+    Timing spans and counters for one question/answer turn.
+
+    Spans are measured in milliseconds from the start of the turn. Worker
+    threads (TTS chunks) record into the same trace, so updates are locked.
+    """
+
+    def __init__(self, session_id=None):
+        self.turn_id = uuid.uuid4().hex[:12]
+        self.session_id = session_id
+        self.started = time.time()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.attrs = {}
+        self.lock = threading.Lock()
+
+    # Function to get the milliseconds elapsed since the turn started
+    def now_ms(self):
+        return (time.perf_counter() - self.origin) * 1000
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Time a block; attributes can be added to the yielded dict inside it."""
+        start = self.now_ms()
+        try:
+            yield attrs
+        finally:
+            self.add_span(name, start, self.now_ms() - start, **attrs)
+
+    def add_span(self, name, start_ms, duration_ms, **attrs):
+        with self.lock:
+            self.spans.append({
+                "name": name,
+                "start_ms": round(start_ms, 1),
+                "duration_ms": round(duration_ms, 1),
+                **attrs,
+            })
+
+    # Function to record the first time something happened, e.g. first token or first audio
+    def mark(self, name):
+        with self.lock:
+            self.attrs.setdefault(name + "_ms", round(self.now_ms(), 1))
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.attrs[name] = self.attrs.get(name, 0) + value
+
+    def set(self, name, value):
+        with self.lock:
+            self.attrs[name] = value
+
+    # Function to sum span durations per stage
+    def stage_totals(self):
+        with self.lock:
+            totals = {}
+            for span in self.spans:
+                totals[span["name"]] = totals.get(span["name"], 0) + span["duration_ms"]
+        return {name: round(ms, 1) for name, ms in totals.items()}
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "turn_id": self.turn_id,
+                "session_id": self.session_id,
+                "started": self.started,
+                "total_ms": round(self.now_ms(), 1),
+                "attrs": dict(self.attrs),
+                "spans": list(self.spans),
+            }
+
+
+_current = threading.local()
+
+
+# Function to get the trace of the turn running on this thread, or None
+def current_trace():
+    return getattr(_current, "trace", None)
+
+
+def set_current_trace(trace):
+    _current.trace = trace
+
+
+# Function to time a block against the current trace, a no-op outside a turn
+@contextmanager
+def span(name, **attrs):
+    trace = current_trace()
+    if trace is None:
+        yield attrs
+        return
+    with trace.span(name, **attrs) as span_attrs:
+        yield span_attrs
+
+
+def mark(name):
+    trace = current_trace()
+    if trace is not None:
+        trace.mark(name)
+
+
+def incr(name, value=1):
+    trace = current_trace()
+    if trace is not None:
+        trace.incr(name, value)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram of seconds."""
+
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.total += seconds
+        self.count += 1
+        for i, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+
+
+class MetricsRegistry:
+    """
+    Process-wide metrics: finished turns go to a JSONL log, per-stage
+    histograms and counters, exported in the Prometheus text format.
+    """
+
+    def __init__(self, log_path=None):
+        self.log_path = log_path if log_path is not None else Config.metrics_log_path
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self.histograms.setdefault(name, Histogram()).observe(seconds)
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    # Function to export values read at scrape time, e.g. a cache's size: source() -> {name: number}
+    def add_gauges(self, prefix, source):
+        with self.lock:
+            self.gauges[prefix] = source
+
+    # Function to record a finished turn in the log, histograms and counters
+    def record_turn(self, trace):
+        record = trace.to_dict()
+        self.incr("turns_total")
+        self.observe("turn", record["total_ms"] / 1000)
+        for stage, ms in trace.stage_totals().items():
+            self.observe(stage, ms / 1000)
+        for name, value in record["attrs"].items():
+            if name.endswith("_ms"):
+                self.observe(name[:-3], value / 1000)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.incr(name + "_total", value)
+
+        if self.log_path:
+            directory = os.path.dirname(self.log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            line = json.dumps(record, ensure_ascii=False)
+            with self.lock:
+                self.rotate_log()
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        return record
+
+    # Function to rotate the turn log once it reaches Config.metrics_log_max_bytes
+    def rotate_log(self):
+        """turn_metrics.jsonl becomes turn_metrics.jsonl.1, older files shift up and the last is dropped."""
+        try:
+            if os.path.getsize(self.log_path) < Config.metrics_log_max_bytes:
+                return
+        except OSError:
+            return
+        backups = Config.metrics_log_backups
+        for index in range(backups - 1, 0, -1):
+            if os.path.exists(f"{self.log_path}.{index}"):
+                os.replace(f"{self.log_path}.{index}", f"{self.log_path}.{index + 1}")
+        if backups:
+            os.replace(self.log_path, f"{self.log_path}.1")
+        else:
+            os.remove(self.log_path)
+
+    # Function to render every metric in the Prometheus text exposition format
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            sources = sorted(self.gauges.items())
+        # Read outside the lock, a source may query a database
+        for prefix, source in sources:
+            try:
+                values = source()
+            except Exception:
+                continue
+            for name, value in sorted(values.items()):
+                metric = f"vf_{prefix}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+        with self.lock:
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"vf_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for bound, count in zip(Histogram.BUCKETS, histogram.counts):
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum {histogram.total:.6f}")
+                lines.append(f"{metric}_count {histogram.count}")
+            for name, value in sorted(self.counters.items()):
+                metric = f"vf_{name}"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# Function to flatten a finished turn into one row for the sidebar panel
+def summarize_turn(record):
+    stages = {}
+    for span in record["spans"]:
+        stages[span["name"]] = stages.get(span["name"], 0) + span["duration_ms"]
+    attrs = record["attrs"]
+    return {
+        "total ms": record["total_ms"],
+        "stt ms": round(stages.get("stt", 0)),
+        "llm first token ms": attrs.get("llm_first_token_ms"),
+        "llm ms": round(stages.get("llm", 0)),
+        "first audio ms": attrs.get("first_audio_ms"),
+        "tts chunks": sum(1 for s in record["spans"] if s["name"] == "tts_chunk"),
+        "tokens in/out": f"{attrs.get('prompt_tokens', 0)}/{attrs.get('completion_tokens', 0)}",
+        "cache hits": attrs.get("answer_cache_hits", 0) + attrs.get("tts_cache_hits", 0),
+        "payload KB": round((attrs.get("html_bytes", 0) + attrs.get("audio_bytes", 0)) / 1024, 1),
+    }
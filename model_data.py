@@ -0,0 +1,273 @@
+import bisect
+import csv
+import io
+import math
+import os
+import re
+import threading
+from config import Config
+
+
+# Function to read a model output file (CSV, or Parquet when pandas is installed) into dicts
+def read_table(path):
+    if path.endswith(".parquet"):
+        try:
+            import pandas as pd
+        except ImportError:
+            raise RuntimeError(f"Reading {path} needs pandas and pyarrow installed")
+        return pd.read_parquet(path).to_dict("records")
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+# Function to convert numeric cells in place, leaving text cells untouched
+def coerce_numbers(rows, columns):
+    for row in rows:
+        for column in columns:
+            value = row.get(column)
+            if isinstance(value, str) and value.strip():
+                number = float(value)
+                row[column] = int(number) if number.is_integer() else number
+    return rows
+
+
+# Function to serialize rows compactly: only the chosen columns, CSV, no padding
+def to_compact_csv(rows, columns):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow([name for name, _ in columns])
+    for row in rows:
+        writer.writerow([render(row) for _, render in columns])
+    return out.getvalue()
+
+
+# Function to compute the great-circle distance in kilometers
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+# Function to normalize a governorate name for lookups ("AL GIZA" -> "giza")
+def governorate_key(name):
+    name = re.sub(r"\s+", " ", str(name)).strip().lower()
+    return re.sub(r"^(al|el) ", "", name)
+
+
+# Spellings users type that differ from the governorate names in the model output
+GOVERNORATE_ALIASES = {
+    "alex": "alexandria",
+    "sharqia": "sharkia",
+    "sharqiya": "sharkia",
+    "gharbiya": "gharbia",
+    "asyut": "assiout",
+    "assiut": "assiout",
+    "ismailia": "ismalia",
+    "ismailiya": "ismalia",
+}
+
+
+class RetailRecommendations:
+    """
+    Retail expansion model output indexed for the queries the prompt needs.
+
+    Rows are kept sorted by rank, with per-governorate lists and a list
+    sorted by Vodafone market share so thresholds are a bisect away.
+    """
+
+    NUMERIC_COLUMNS = [
+        "vodafone_acquistion_marketshare_montly",
+        "max_competitor_market_share",
+        "median_distance_to_nearest_store",
+        "store_id_of_the_nearest_Store",
+        "Rank",
+        "recommended_latitude",
+        "recommended_longitude",
+        "competitor_Etisalat",
+        "competitor_Orange",
+        "competitor_WE",
+    ]
+
+    # Columns sent to the model, with short names and percentages instead of fractions
+    COMPACT_COLUMNS = [
+        ("rank", lambda r: r["Rank"]),
+        ("governorate", lambda r: r["governorate"]),
+        ("qism", lambda r: r["qism"]),
+        ("sheyakha", lambda r: r["sheyakha"]),
+        ("vf_share", lambda r: f"{r['vodafone_acquistion_marketshare_montly']:.0%}"),
+        ("top_competitor", lambda r: r["competitor_name_has_maximum_marketshare_excludinng_vf"]),
+        ("competitor_share", lambda r: f"{r['max_competitor_market_share']:.0%}"),
+        ("nearest_vf_store", lambda r: r["store_name_of_the_nearest_Store"]),
+        ("distance_km", lambda r: f"{r['median_distance_to_nearest_store']:.1f}"),
+        ("lat", lambda r: r["recommended_latitude"]),
+        ("lon", lambda r: r["recommended_longitude"]),
+        ("attraction", lambda r: r["attraction_index"]),
+        ("population", lambda r: r["population"]),
+        ("visitors_per_terminal", lambda r: r["visitors_per_terminal"]),
+        ("competitor_stores_ET_ORG_WE", lambda r: f"{r['competitor_Etisalat']}/{r['competitor_Orange']}/{r['competitor_WE']}"),
+    ]
+
+    def __init__(self, rows):
+        self.rows = sorted(coerce_numbers(rows, self.NUMERIC_COLUMNS), key=lambda r: r["Rank"])
+        self.by_governorate = {}
+        for row in self.rows:
+            self.by_governorate.setdefault(governorate_key(row["governorate"]), []).append(row)
+        self.by_share = sorted(self.rows, key=lambda r: r["vodafone_acquistion_marketshare_montly"])
+        self.share_keys = [r["vodafone_acquistion_marketshare_montly"] for r in self.by_share]
+
+    @classmethod
+    def load(cls, path=None):
+        return cls(read_table(path or Config.retail_data_path))
+
+    # Function to find the governorates mentioned in a piece of text
+    def governorates_in(self, text):
+        words = governorate_key(text)
+        for alias, name in GOVERNORATE_ALIASES.items():
+            words = re.sub(rf"\b{alias}\b", name, words)
+        return [key for key in self.by_governorate if re.search(rf"\b{re.escape(key)}\b", words)]
+
+    # Function to filter rows, every filter is optional and results stay in rank order
+    def query(self, governorates=None, max_rank=None, max_vf_share=None, min_competitor_share=None, limit=None):
+        if governorates:
+            rows = sorted(
+                (row for key in governorates for row in self.by_governorate.get(key, [])),
+                key=lambda r: r["Rank"],
+            )
+        else:
+            rows = self.rows
+        if max_vf_share is not None:
+            low = {id(r) for r in self.by_share[:bisect.bisect_left(self.share_keys, max_vf_share)]}
+            rows = [r for r in rows if id(r) in low]
+        if max_rank is not None:
+            rows = [r for r in rows if r["Rank"] <= max_rank]
+        if min_competitor_share is not None:
+            rows = [r for r in rows if r["max_competitor_market_share"] >= min_competitor_share]
+        return rows[:limit] if limit else rows
+
+    # Function to find the recommended locations closest to a point
+    def nearest(self, latitude, longitude, k=3):
+        return sorted(
+            self.rows,
+            key=lambda r: haversine_km(latitude, longitude, r["recommended_latitude"], r["recommended_longitude"]),
+        )[:k]
+
+    def to_compact(self, rows):
+        return to_compact_csv(rows, self.COMPACT_COLUMNS)
+
+
+class BillboardImpressions:
+    """Billboard model output indexed by governorate and sorted by rank."""
+
+    NUMERIC_COLUMNS = ["Rank", "Hourly Impression"]
+
+    COMPACT_COLUMNS = [
+        ("rank", lambda r: r["Rank"]),
+        ("region", lambda r: r["Region"]),
+        ("governorate", lambda r: r["Governorate"]),
+        ("qism", lambda r: r["Qism"]),
+        ("hourly_impressions", lambda r: r["Hourly Impression"]),
+    ]
+
+    def __init__(self, rows):
+        self.rows = sorted(coerce_numbers(rows, self.NUMERIC_COLUMNS), key=lambda r: r["Rank"])
+        self.by_governorate = {}
+        for row in self.rows:
+            self.by_governorate.setdefault(governorate_key(row["Governorate"]), []).append(row)
+
+    @classmethod
+    def load(cls, path=None):
+        return cls(read_table(path or Config.billboard_data_path))
+
+    def query(self, governorates=None, limit=None):
+        if governorates:
+            rows = [r for r in self.rows if governorate_key(r["Governorate"]) in governorates]
+        else:
+            rows = self.rows
+        return rows[:limit] if limit else rows
+
+    def to_compact(self, rows):
+        return to_compact_csv(rows, self.COMPACT_COLUMNS)
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+# Function to get a loaded table, reloading it when the file on disk changes
+def get_table(cls, path):
+    mtime = os.path.getmtime(path)
+    with _tables_lock:
+        cached = _tables.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, cls.load(path))
+            _tables[path] = cached
+    return cached[1]
+
+
+def get_retail_recommendations():
+    return get_table(RetailRecommendations, Config.retail_data_path)
+
+
+def get_billboard_impressions():
+    return get_table(BillboardImpressions, Config.billboard_data_path)
+
+
+# Function to pick the retail rows a question is about
+def select_retail_rows(question):
+    """
+    Select the retail recommendations matching a question
+
+    Understands governorate names ("top 3 stores in Giza"), "top N",
+    low market share and a "lat, lon" point for a nearest-location lookup.
+    With no filter, or when nothing matches, every row is returned.
+    """
+    store = get_retail_recommendations()
+    text = question.lower()
+
+    point = re.search(r"(-?\d{1,2}\.\d+)\s*,\s*(-?\d{1,3}\.\d+)", text)
+    if point:
+        return store.nearest(float(point.group(1)), float(point.group(2)), k=Config.retail_nearest_k)
+
+    limit = None
+    top = re.search(r"\btop\s+(\d+)\b|\b(\d+)\s+(?:best\s+)?(?:stores?|locations?|areas?|places?|sites?)\b", text)
+    if top:
+        limit = int(top.group(1) or top.group(2))
+
+    max_vf_share = Config.low_market_share if re.search(r"\blow(est)?\b.*\bshare\b", text) else None
+    rows = store.query(
+        governorates=store.governorates_in(text),
+        max_vf_share=max_vf_share,
+        limit=limit,
+    )
+    return rows or store.rows
+
+
+# Function to pick the billboard rows a question is about
+def select_billboard_rows(question):
+    store = get_billboard_impressions()
+    return store.query(governorates=[key for key in store.by_governorate if key in governorate_key(question)])
+
+
+# Function to build the retail data section of the prompt for a question
+def retail_data_section(question=None):
+    store = get_retail_recommendations()
+    rows = store.rows if question is None else select_retail_rows(question)
+    return (
+        "\n### 📊 Model Output for Retail Expansion\n\n"
+        "Shares are Vodafone acquisition and top competitor market share. "
+        "Google Maps link for a location: https://www.google.com/maps?q=<lat>,<lon>\n\n"
+        "```csv\n" + store.to_compact(rows) + "```\n"
+    )
+
+
+# Function to build the billboard data section of the prompt for a question
+def billboard_data_section(question=None):
+    store = get_billboard_impressions()
+    rows = store.rows if question is None else select_billboard_rows(question) or store.rows
+    return (
+        "\n### 📊 Model Output for BillBoard locatoins:\n"
+        + store.to_compact(rows)
+    )
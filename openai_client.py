@@ -0,0 +1,194 @@
+import os
+import random
+import threading
+import time
+import httpx
+import openai
+from openai import OpenAI
+from config import Config
+
+# Errors worth retrying: network trouble, timeouts, rate limits and server errors
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+# Function to find the API key: environment first, then Streamlit secrets
+def get_api_key():
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if api_key:
+        return api_key
+    import streamlit as st
+    return st.secrets["openai"]["api_key"]
+
+
+class TokenBucket:
+    """Token-rate limiter refilled continuously up to one minute's worth of tokens."""
+
+    def __init__(self, tokens_per_minute):
+        self.rate = tokens_per_minute / 60.0
+        self.capacity = tokens_per_minute
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+
+    # Function to block until the requested number of tokens is available
+    def take(self, tokens):
+        tokens = min(tokens, self.capacity)
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                self.condition.wait((tokens - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """
+    Process-wide backpressure for API calls: a cap on concurrent in-flight
+    requests per call type and a shared chat token rate.
+    """
+
+    def __init__(self):
+        self.slots = {
+            call_type: threading.BoundedSemaphore(limit)
+            for call_type, limit in Config.openai_max_concurrency.items()
+        }
+        self.tokens = TokenBucket(Config.openai_tokens_per_minute) if Config.openai_tokens_per_minute else None
+
+
+class ManagedStream:
+    """Chat stream that keeps its concurrency slot until it is exhausted or closed."""
+
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+        self.closed = False
+        # A cancelled turn closes the stream from another thread
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        try:
+            for chunk in self.stream:
+                yield chunk
+        finally:
+            self.close()
+
+    # Function to close the stream once, returns False when it was already closed
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return False
+            self.closed = True
+        try:
+            self.stream.close()
+        finally:
+            self.release()
+        return True
+
+
+_client = None
+_client_lock = threading.Lock()
+limiter = RateLimiter()
+
+
+# Function to get the shared client: one connection pool for chat, transcription and speech
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            http_client = openai.DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=Config.openai_max_connections,
+                    max_keepalive_connections=Config.openai_max_keepalive,
+                    keepalive_expiry=Config.openai_keepalive_expiry,
+                ),
+            )
+            _client = OpenAI(
+                api_key=get_api_key(),
+                base_url=os.environ.get("OPENAI_BASE_URL") or Config.openai_base_url,
+                http_client=http_client,
+                # Retries are handled here so they respect the rate limiter
+                max_retries=0,
+            )
+        return _client
+
+
+# Function to compute the wait before a retry: server hint if any, else full jitter backoff
+def retry_delay(attempt, error):
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), Config.openai_max_backoff)
+        except ValueError:
+            pass
+    return random.uniform(0, min(Config.openai_max_backoff, Config.openai_retry_backoff * (2 ** attempt)))
+
+
+# Function to run one API call with the call type's timeout, slot and retry policy
+def call_with_retries(call_type, make_call, tokens=0, hold_slot=False):
+    """
+    Args:
+        call_type (str): "chat", "transcription" or "speech"
+        make_call (callable): make_call(client) performs the request
+        tokens (int): Estimated tokens to take from the rate limiter
+        hold_slot (bool): Keep the concurrency slot after returning (streams release it on close)
+    """
+    client = get_client().with_options(timeout=Config.openai_timeouts[call_type])
+    for attempt in range(Config.openai_max_retries + 1):
+        if tokens and limiter.tokens is not None:
+            limiter.tokens.take(tokens)
+        slot = limiter.slots[call_type]
+        slot.acquire()
+        try:
+            result = make_call(client)
+        except RETRYABLE_ERRORS as e:
+            slot.release()
+            if attempt == Config.openai_max_retries:
+                raise
+            time.sleep(retry_delay(attempt, e))
+            continue
+        except Exception:
+            slot.release()
+            raise
+        if hold_slot:
+            return result, slot.release
+        slot.release()
+        return result
+
+
+# Function to estimate the tokens a chat request will use for the rate limiter
+def estimate_chat_tokens(messages, max_tokens=None):
+    prompt_chars = sum(len(m["content"]) for m in messages)
+    return prompt_chars // 4 + (max_tokens or Config.openai_expected_completion_tokens)
+
+
+# Function to create a chat completion, stream=True returns a ManagedStream
+def chat_completion(**kwargs):
+    tokens = estimate_chat_tokens(kwargs["messages"], kwargs.get("max_tokens"))
+    if kwargs.get("stream"):
+        stream, release = call_with_retries(
+            "chat", lambda client: client.chat.completions.create(**kwargs), tokens, hold_slot=True
+        )
+        return ManagedStream(stream, release)
+    return call_with_retries("chat", lambda client: client.chat.completions.create(**kwargs), tokens)
+
+
+# Function to transcribe audio, the file is rewound before each attempt
+def transcription(**kwargs):
+    def make_call(client):
+        kwargs["file"].seek(0)
+        return client.audio.transcriptions.create(**kwargs)
+    return call_with_retries("transcription", make_call)
+
+
+# Function to synthesize speech and return the audio bytes
+def speech(**kwargs):
+    return call_with_retries("speech", lambda client: client.audio.speech.create(**kwargs).read())
@@ -0,0 +1,183 @@
+import logging
+import os
+import re
+import threading
+from config import Config
+from model_data import billboard_data_section, retail_data_section
+
+logger = logging.getLogger(__name__)
+
+# Separator used between prompt sections
+SECTION_SEPARATOR = "\n---\n"
+
+# Prompt sections after the intro, in prompt order, tagged with the
+# intent that needs them. Instructions come first, then the model output
+# data, which is built per question from the rows it matches.
+SECTIONS = [
+    ("retail", Config.prompt_retail),
+    ("billboard", Config.prompt_billboard),
+    ("cvm", Config.prompt_cvm),
+    ("other", Config.prompt_other),
+    ("retail", retail_data_section),
+    ("billboard", billboard_data_section),
+]
+
+# Weighted keyword patterns for the local intent classifier
+INTENT_PATTERNS = {
+    "retail": [
+        (r"\bretail\b", 3),
+        # A "lat, lon" point asks for the nearest recommended locations
+        (r"-?\d{1,2}\.\d+\s*,\s*-?\d{1,3}\.\d+", 3),
+        (r"\bstores?\b|\bshops?\b|\bbranch(es)?\b|\boutlets?\b", 2),
+        (r"\bexpan(d|sion)\b|\bopen(ing)?\b", 1),
+        (r"\blocations?\b|\bareas?\b|\bgovernorates?\b", 1),
+        (r"\bcairo\b|\bgiza\b|\bsharkia\b|\bgharbia\b|\bassiut\b|\bassiout\b|\bismailia\b|\balexandria\b", 1),
+        (r"\bcompetitors?\b|\betisalat\b|\borange\b", 1),
+    ],
+    "billboard": [
+        (r"\bbillboards?\b", 3),
+        (r"\badsl\b|\bfixed\b|\bhome internet\b|\bbroadband\b", 3),
+        (r"\bimpressions?\b|\boutdoor\b|\badverti[sz]", 2),
+        (r"\bage\b|\bgender\b|\bmale\b|\bfemale\b|\brate plans?\b|\btariffs?\b|\bmi usage\b|\bmobile internet\b", 2),
+        (r"\bcampaign\b|\bmarketing\b|\bpersona\b|\baudience\b", 1),
+    ],
+    "cvm": [
+        (r"\bcross[- ]?net\b", 3),
+        (r"\bcvm\b|\bchurn\b|\barpu\b|\brecharge\b|\bflex\b", 2),
+        (r"\bdrop(ped|s)?\b|\bdecline\b|\bdecrease\b", 1),
+        (r"\bmarket ?share\b|\busage\b", 1),
+    ],
+}
+
+# Small talk that needs no use-case playbook at all
+SMALL_TALK = re.compile(
+    r"^\s*(hi|hello|hey|thanks|thank you|good (morning|afternoon|evening)|"
+    r"who are you|how are you|bye|goodbye)\b[\s\w]{0,20}[.!?]*\s*$",
+    re.IGNORECASE,
+)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+# Function to count tokens, uses tiktoken when installed and a 4 chars/token estimate otherwise
+def count_tokens(text):
+    if tiktoken is not None:
+        try:
+            return len(tiktoken.encoding_for_model(Config.model).encode(text))
+        except Exception:
+            pass
+    return (len(text) + 3) // 4
+
+
+# Function to score a piece of text against every intent
+def score_intents(text):
+    text = text.lower()
+    scores = {}
+    for intent, patterns in INTENT_PATTERNS.items():
+        score = sum(weight for pattern, weight in patterns if re.search(pattern, text))
+        if score:
+            scores[intent] = score
+    return scores
+
+
+# Function to pick the prompt sections a question needs
+def classify_intent(question, history=[]):
+    """
+    Classify a question into the prompt sections it needs
+
+    Args:
+        question (str): The user's question
+        history (list): Previous chat messages, used for short follow-ups
+
+    Returns:
+        list: Intent names, or None when unsure and the whole prompt should be sent
+    """
+    if SMALL_TALK.match(question):
+        return ["other"]
+
+    scores = score_intents(question)
+
+    # Follow-ups like "males 25-35 on high MI usage" continue the previous topic
+    if not scores:
+        recent = [m["content"] for m in history if m["role"] == "user" and m["content"] != question]
+        for previous in reversed(recent[-2:]):
+            scores = score_intents(previous)
+            if scores:
+                break
+
+    confident = [intent for intent, score in scores.items() if score >= Config.intent_min_score]
+    if not confident:
+        return None
+    return confident
+
+
+# Function to assemble the system prompt from the sections a question needs
+def build_system_prompt(question, history=[]):
+    """
+    Build the system prompt for one request
+
+    Args:
+        question (str): The user's question
+        history (list): Previous chat messages
+
+    Returns:
+        tuple: (system prompt, report dict with intents and prompt token counts)
+    """
+    intents = classify_intent(question, history) if Config.prompt_routing else None
+
+    wanted = None if intents is None else set(intents) | {"other"}
+    try:
+        full_tokens = full_prompt_tokens()
+        if intents is None:
+            prompt = assemble_prompt()
+            tokens = full_tokens
+        else:
+            prompt = assemble_prompt(wanted, question)
+            tokens = count_tokens(prompt)
+    except Exception:
+        # A missing or malformed model output file must not fail the answer:
+        # the instructions are still sent, without the data
+        logger.exception("Model output data unavailable, prompt sent without it")
+        prompt = assemble_prompt(wanted, question, with_data=False)
+        tokens = full_tokens = count_tokens(prompt)
+
+    report = {
+        "intents": intents or ["all"],
+        "prompt_tokens": tokens,
+        "full_prompt_tokens": full_tokens,
+    }
+    report["saved_tokens"] = report["full_prompt_tokens"] - report["prompt_tokens"]
+    logger.info(
+        "prompt intents=%s tokens=%d saved=%d",
+        ",".join(report["intents"]), report["prompt_tokens"], report["saved_tokens"],
+    )
+    return prompt, report
+
+
+# Function to join the intro and the wanted sections, all of them with every data row by default
+def assemble_prompt(intents=None, question=None, with_data=True):
+    sections = [Config.prompt_intro]
+    for intent, section in SECTIONS:
+        if intents is not None and intent not in intents:
+            continue
+        if callable(section) and not with_data:
+            continue
+        sections.append(section(question) if callable(section) else section)
+    return SECTION_SEPARATOR.join(sections)
+
+
+_full_prompt_tokens = None
+_full_prompt_lock = threading.Lock()
+
+
+# Function to count the tokens of the whole prompt, recounted only when a data file changes
+def full_prompt_tokens():
+    global _full_prompt_tokens
+    mtimes = (os.path.getmtime(Config.retail_data_path), os.path.getmtime(Config.billboard_data_path))
+    with _full_prompt_lock:
+        if _full_prompt_tokens is None or _full_prompt_tokens[0] != mtimes:
+            _full_prompt_tokens = (mtimes, count_tokens(assemble_prompt()))
+        return _full_prompt_tokens[1]
@@ -0,0 +1,369 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import closing
+from urllib.parse import urlparse
+from history import droppable_prefix
+from config import Config
+
+# Roles are stored as one letter
+ROLE_CODES = {"user": "u", "assistant": "a", "system": "s"}
+ROLE_NAMES = {code: role for role, code in ROLE_CODES.items()}
+
+# Messages longer than this are zlib-compressed
+COMPRESS_MIN_BYTES = 200
+
+
+# Function to encode a chat message compactly: role letter and content, compressed when long
+def pack_message(message):
+    raw = json.dumps(
+        [ROLE_CODES.get(message["role"], message["role"]), message["content"]],
+        ensure_ascii=False, separators=(",", ":"),
+    ).encode("utf-8")
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        return b"z" + zlib.compress(raw, 6)
+    return b"j" + raw
+
+
+def unpack_message(data):
+    data = bytes(data)
+    raw = zlib.decompress(data[1:]) if data[:1] == b"z" else data[1:]
+    role, content = json.loads(raw)
+    return {"role": ROLE_NAMES.get(role, role), "content": content}
+
+
+class SessionState:
+    """A stored conversation: its messages and the ConversationMemory summary."""
+
+    def __init__(self, history=None, summary="", summarized=0):
+        self.history = history or []
+        self.summary = summary
+        self.summarized = summarized
+
+
+class SessionStore:
+    """
+    Conversation storage shared by every worker process.
+
+    Each turn only appends its new messages. A session keeps at most
+    max_bytes of packed messages: the oldest whole turns already folded into
+    the summary are dropped first, so a resumed conversation still has every
+    message the summary does not cover. It expires ttl seconds after its
+    last turn.
+    """
+
+    def __init__(self, ttl=None, max_bytes=None):
+        self.ttl = ttl if ttl is not None else Config.session_ttl
+        self.max_bytes = max_bytes or Config.session_max_bytes
+
+    # Function to load a conversation, an unknown or expired session is empty
+    def load(self, session_id):
+        raise NotImplementedError
+
+    # Function to append a turn's messages and save the memory summary with them
+    def append(self, session_id, messages, summary=None, newly_summarized=0):
+        """
+        Args:
+            session_id (str): Conversation id
+            messages (list): New messages only, oldest first
+            summary (str): ConversationMemory.summary, None keeps the stored one
+            newly_summarized (int): Messages folded into the summary since the
+                last append, see ConversationMemory.pop_newly_summarized
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+
+class SQLiteSessionStore(SessionStore):
+    """Session store in a local SQLite file, for one host or a shared volume."""
+
+    def __init__(self, path=None, ttl=None, max_bytes=None):
+        super().__init__(ttl, max_bytes)
+        self.path = path or Config.session_store_path
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, summary TEXT NOT NULL DEFAULT '', "
+                "summarized INTEGER NOT NULL DEFAULT 0, bytes INTEGER NOT NULL DEFAULT 0, "
+                "updated REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "session_id TEXT NOT NULL, seq INTEGER NOT NULL, data BLOB NOT NULL, "
+                "PRIMARY KEY (session_id, seq))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+
+    # Function to open a connection, one per call so any thread can use the store
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def load(self, session_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT summary, summarized, updated FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None or (self.ttl and time.time() - row[2] > self.ttl):
+                return SessionState()
+            rows = conn.execute(
+                "SELECT data FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return SessionState([unpack_message(data) for data, in rows], row[0], row[1])
+
+    def append(self, session_id, messages, summary=None, newly_summarized=0):
+        packed = [pack_message(message) for message in messages]
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT summarized, bytes, updated FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                if row is not None and self.ttl and now - row[2] > self.ttl:
+                    conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                    conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                    row = None
+                stored_summarized, total = (row[0], row[1]) if row is not None else (0, 0)
+
+                last, count = conn.execute(
+                    "SELECT COALESCE(MAX(seq), -1), COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                conn.executemany(
+                    "INSERT INTO messages (session_id, seq, data) VALUES (?, ?, ?)",
+                    [(session_id, last + 1 + i, sqlite3.Binary(data)) for i, data in enumerate(packed)],
+                )
+                total += sum(len(data) for data in packed)
+                stored_summarized = min(stored_summarized + newly_summarized, count + len(packed))
+
+                # Over the cap: drop the oldest summarized turns, the summary index moves with them
+                if total > self.max_bytes:
+                    rows = conn.execute(
+                        "SELECT seq, data FROM messages WHERE session_id = ? ORDER BY seq LIMIT ?",
+                        (session_id, stored_summarized + 1),
+                    ).fetchall()
+                    sizes = [len(data) for _, data in rows]
+                    drop = droppable_prefix(
+                        [unpack_message(data) for _, data in rows], stored_summarized,
+                        total - self.max_bytes, sizes,
+                    )
+                    if drop:
+                        conn.execute(
+                            "DELETE FROM messages WHERE session_id = ? AND seq <= ?", (session_id, rows[drop - 1][0])
+                        )
+                        total -= sum(sizes[:drop])
+                        stored_summarized -= drop
+
+                conn.execute(
+                    "INSERT INTO sessions (session_id, summary, summarized, bytes, updated) "
+                    "VALUES (?, COALESCE(?, ''), ?, ?, ?) "
+                    "ON CONFLICT (session_id) DO UPDATE SET summary = COALESCE(?, summary), "
+                    "summarized = excluded.summarized, bytes = excluded.bytes, updated = excluded.updated",
+                    (session_id, summary, stored_summarized, total, now, summary),
+                )
+                if self.ttl:
+                    self._expire(conn, now)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    # Function to drop sessions whose last turn is older than the TTL
+    def _expire(self, conn, now):
+        expired = [
+            session_id for session_id, in conn.execute(
+                "SELECT session_id FROM sessions WHERE updated < ?", (now - self.ttl,)
+            ).fetchall()
+        ]
+        for session_id in expired:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def delete(self, session_id):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+
+class RedisError(Exception):
+    """Error reply from the Redis server."""
+
+
+class RedisConnection:
+    """
+    Minimal Redis protocol (RESP2) client: pipelined commands over one
+    socket, reconnecting once if the connection was dropped.
+    """
+
+    def __init__(self, url=None, timeout=5):
+        parsed = urlparse(url or Config.session_redis_url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def _open(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.reader = self.sock.makefile("rb")
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            self._send(setup)
+
+    def close(self):
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+            self.sock = self.reader = None
+
+    # Function to encode commands as RESP arrays of bulk strings
+    @staticmethod
+    def encode(command):
+        parts = [b"*%d\r\n" % len(command)]
+        for arg in command:
+            if isinstance(arg, str):
+                arg = arg.encode("utf-8")
+            elif not isinstance(arg, (bytes, bytearray)):
+                arg = str(arg).encode("ascii")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected Redis reply {line!r}")
+
+    def _send(self, commands):
+        self.sock.sendall(b"".join(self.encode(command) for command in commands))
+        replies = [self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    # Function to send commands in one round trip and return their replies
+    def execute(self, *commands):
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.sock is None:
+                        self._open()
+                    return self._send(commands)
+                except (ConnectionError, OSError):
+                    self.close()
+                    if attempt:
+                        raise
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Session store on a Redis server, shared by workers on any host.
+
+    A session is a list of packed messages and a hash with the summary, the
+    summarized count and the packed size; both keys expire together.
+    """
+
+    def __init__(self, url=None, ttl=None, max_bytes=None, prefix="vf:session:"):
+        super().__init__(ttl, max_bytes)
+        self.redis = RedisConnection(url)
+        self.prefix = prefix
+
+    def _keys(self, session_id):
+        return self.prefix + session_id + ":messages", self.prefix + session_id + ":meta"
+
+    def load(self, session_id):
+        messages_key, meta_key = self._keys(session_id)
+        rows, meta = self.redis.execute(("LRANGE", messages_key, 0, -1), ("HGETALL", meta_key))
+        meta = {meta[i].decode(): meta[i + 1].decode("utf-8") for i in range(0, len(meta), 2)}
+        return SessionState(
+            [unpack_message(data) for data in rows],
+            meta.get("summary", ""),
+            int(meta.get("summarized", 0)),
+        )
+
+    def append(self, session_id, messages, summary=None, newly_summarized=0):
+        messages_key, meta_key = self._keys(session_id)
+        packed = [pack_message(message) for message in messages]
+        commands = [
+            ("RPUSH", messages_key, *packed),
+            ("HINCRBY", meta_key, "bytes", sum(len(data) for data in packed)),
+            ("HINCRBY", meta_key, "summarized", newly_summarized),
+        ]
+        if summary is not None:
+            commands.append(("HSET", meta_key, "summary", summary))
+        if self.ttl:
+            commands += [("EXPIRE", messages_key, int(self.ttl)), ("EXPIRE", meta_key, int(self.ttl))]
+        count, total, summarized = self.redis.execute(*commands)[:3]
+
+        # The summary cannot cover more messages than are stored, e.g. after the session expired
+        if summarized > count:
+            self.redis.execute(("HSET", meta_key, "summarized", count))
+            summarized = count
+
+        # Over the cap: drop the oldest summarized turns, the summary index moves with them
+        if total > self.max_bytes:
+            rows, = self.redis.execute(("LRANGE", messages_key, 0, summarized))
+            sizes = [len(data) for data in rows]
+            drop = droppable_prefix([unpack_message(data) for data in rows], summarized, total - self.max_bytes, sizes)
+            if drop:
+                self.redis.execute(
+                    ("LTRIM", messages_key, drop, -1),
+                    ("HINCRBY", meta_key, "bytes", -sum(sizes[:drop])),
+                    ("HINCRBY", meta_key, "summarized", -drop),
+                )
+
+    def delete(self, session_id):
+        self.redis.execute(("DEL", *self._keys(session_id)))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# Function to get the configured session store, None when conversations are not persisted
+def get_session_store():
+    global _store
+    with _store_lock:
+        if _store is None and Config.session_store:
+            if Config.session_store == "redis":
+                _store = RedisSessionStore()
+            elif Config.session_store == "sqlite":
+                _store = SQLiteSessionStore()
+            else:
+                raise ValueError(f"Unknown session store {Config.session_store!r}")
+        return _store
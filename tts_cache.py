@@ -0,0 +1,119 @@
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+from config import Config
+
+
+# Function to normalize chunk text so trivially different spacing shares an entry
+def normalize_tts_text(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class AudioCache:
+    """
+    On-disk cache of synthesized audio keyed by (TTS model, voice, format, chunk text).
+
+    Entries live in a SQLite database so several Streamlit sessions and
+    processes can read and write it at the same time. When the stored audio
+    grows past the byte budget the least recently used entries are evicted.
+    """
+
+    def __init__(self, path=None, max_bytes=None):
+        self.path = path or Config.tts_cache_path
+        self.max_bytes = max_bytes if max_bytes is not None else Config.tts_cache_max_bytes
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS audio ("
+                "key TEXT PRIMARY KEY, audio BLOB NOT NULL, "
+                "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS audio_last_access ON audio (last_access)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+
+    # Function to open a connection, one per call so any thread can use the cache
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    # Function to build the cache key of a chunk
+    @staticmethod
+    def make_key(model, voice, text, audio_format="mp3"):
+        raw = "\x1f".join([model, voice, audio_format, normalize_tts_text(text)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # Function to bump a hit/miss counter
+    @staticmethod
+    def _count(conn, name):
+        conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    # Function to read a chunk from the cache, returns None on a miss
+    def get(self, model, voice, text, audio_format="mp3"):
+        key = self.make_key(model, voice, text, audio_format)
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT audio FROM audio WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self._count(conn, "misses")
+                else:
+                    conn.execute(
+                        "UPDATE audio SET last_access = ? WHERE key = ?", (time.time(), key)
+                    )
+                    self._count(conn, "hits")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return row[0] if row is not None else None
+
+    # Function to store a chunk and evict the least recently used entries over budget
+    def put(self, model, voice, text, audio_bytes, audio_format="mp3"):
+        key = self.make_key(model, voice, text, audio_format)
+        if len(audio_bytes) > self.max_bytes:
+            return
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO audio (key, audio, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, sqlite3.Binary(audio_bytes), len(audio_bytes), time.time()),
+                )
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM audio").fetchone()[0]
+                if total > self.max_bytes:
+                    for old_key, size in conn.execute(
+                        "SELECT key, size FROM audio ORDER BY last_access"
+                    ).fetchall():
+                        if total <= self.max_bytes:
+                            break
+                        conn.execute("DELETE FROM audio WHERE key = ?", (old_key,))
+                        total -= size
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    # Function to report hit/miss counters and the current cache size
+    def stats(self):
+        with closing(self._connect()) as conn:
+            counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM audio"
+            ).fetchone()
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "entries": entries,
+            "bytes": size,
+        }
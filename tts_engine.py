@@ -0,0 +1,123 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import metrics
+from openai_client import speech
+from config import Config
+
+
+class SpeechSynthesizer:
+    """
+    Synthesize TTS chunks concurrently while handing them back in order.
+
+    One instance is shared by every session in the process, so the thread
+    pool size is a process-wide cap on in-flight speech requests. Timeouts
+    and retries come from the shared openai_client layer. When an
+    AudioCache is given, cached chunks skip the API call entirely.
+    """
+
+    def __init__(self, max_workers=None, cache=None):
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or Config.tts_max_concurrency,
+            thread_name_prefix="tts",
+        )
+
+    # Function to synthesize a chunk and store it in the audio cache
+    def synthesize(self, text):
+        audio_bytes = speech(
+            model=Config.tts_model,
+            voice=Config.tts_voice,
+            input=text,
+            response_format=Config.tts_format,
+        )
+
+        if self.cache is not None:
+            try:
+                self.cache.put(Config.tts_model, Config.tts_voice, text, audio_bytes, Config.tts_format)
+            except Exception:
+                pass
+        return audio_bytes
+
+    # Function to look a chunk up in the audio cache, returns None on a miss
+    def cached(self, text):
+        if self.cache is None:
+            return None
+        try:
+            return self.cache.get(Config.tts_model, Config.tts_voice, text, Config.tts_format)
+        except Exception:
+            return None
+
+    # Function to synthesize a chunk on a pool thread and time it against the turn
+    def _synthesize_traced(self, text, trace):
+        start = trace.now_ms()
+        audio_bytes = self.synthesize(text)
+        trace.add_span("tts_chunk", start, trace.now_ms() - start,
+                       chars=len(text), bytes=len(audio_bytes), cached=False)
+        return audio_bytes
+
+    # Function to schedule a chunk on the shared pool, cache hits complete immediately
+    def submit(self, text):
+        trace = metrics.current_trace()
+        started = time.perf_counter()
+        audio_bytes = self.cached(text)
+        if audio_bytes is not None:
+            if trace is not None:
+                trace.incr("tts_cache_hits")
+                trace.add_span("tts_chunk", trace.now_ms(), (time.perf_counter() - started) * 1000,
+                               chars=len(text), bytes=len(audio_bytes), cached=True)
+            future = Future()
+            future.set_result(audio_bytes)
+            return future
+        if trace is not None:
+            return self.executor.submit(self._synthesize_traced, text, trace)
+        return self.executor.submit(self.synthesize, text)
+
+    # Function to cancel queued chunks of an abandoned turn and count the work saved
+    @staticmethod
+    def cancel_pending(pending):
+        """
+        Args:
+            pending (list): (future, text) pairs; chunks already being synthesized finish
+
+        Returns:
+            int: Number of speech requests that were never sent
+        """
+        cancelled = 0
+        for future, text in list(pending):
+            if future.cancel():
+                cancelled += 1
+                metrics.registry.incr("tts_requests_cancelled")
+                metrics.registry.incr("tts_chars_saved", len(text))
+        return cancelled
+
+    # Function to synthesize many chunks and yield them in their original order
+    def synthesize_in_order(self, chunks, cancel=None):
+        """
+        Submit every chunk at once and yield the results in order
+
+        Chunk 0 is yielded as soon as it is ready, even while later chunks
+        are still being synthesized.
+
+        Args:
+            chunks (list): Text chunks to synthesize
+            cancel (CancelToken): Stops yielding and drops queued chunks when the turn is cancelled
+
+        Yields:
+            tuple: (chunk index, audio bytes or None, exception or None)
+        """
+        pending = [(self.submit(chunk), chunk) for chunk in chunks]
+        if cancel is not None:
+            cancel.on_cancel(lambda: self.cancel_pending(pending))
+        try:
+            for i, (future, _) in enumerate(pending):
+                if cancel is not None and cancel.cancelled:
+                    return
+                try:
+                    yield i, future.result(), None
+                except Exception as e:
+                    if cancel is not None and cancel.cancelled:
+                        return
+                    yield i, None, e
+        finally:
+            # When the caller stops early nobody will play the rest; finished chunks are not counted
+            self.cancel_pending(pending)
@@ -0,0 +1,180 @@
+import re
+import unicodedata
+from config import Config
+
+# Words ending in a period that do not end a sentence
+ABBREVIATIONS = {
+    "e.g", "i.e", "etc", "vs", "approx", "dr", "mr", "mrs", "ms", "st", "sq", "inc",
+    "ltd", "jan", "feb", "aug", "sep", "sept", "oct", "nov", "dec", "dept", "govt",
+}
+
+# Candidate sentence end: terminal punctuation, optional closing quotes or brackets, then whitespace
+BOUNDARY = re.compile(r"[.!?]+[\"')\]]*(?=\s)|\n")
+INITIALS = re.compile(r"([A-Za-z]\.)*[A-Za-z]")
+
+IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+LINK = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+URL = re.compile(r"https?://\S+|www\.\S+")
+CODE_FENCE = re.compile(r"```.*?(```|$)", re.DOTALL)
+# Underscores only mark emphasis at word boundaries, as in CommonMark, so snake_case stays intact
+EMPHASIS = re.compile(r"(\*\*|\*|~~|`)(?=\S)(.+?)(?<=\S)\1|(?<!\w)(__|_)(?=\S)(.+?)(?<=\S)\3(?!\w)")
+HEADING = re.compile(r"^[ \t]{0,3}#{1,6}[ \t]*", re.MULTILINE)
+BLOCKQUOTE = re.compile(r"^[ \t]*>[ \t]?", re.MULTILINE)
+BULLET = re.compile(r"^[ \t]*[-*+•][ \t]+", re.MULTILINE)
+NUMBERED = re.compile(r"^[ \t]*(\d+)[.)][ \t]+", re.MULTILINE)
+RULE = re.compile(r"^[ \t]*([-*_][ \t]*){3,}$", re.MULTILINE)
+TABLE_SEPARATOR = re.compile(r"^[ \t]*\|?[ \t]*:?-{2,}:?[ \t]*(\|[ \t]*:?-{2,}:?[ \t]*)*\|?[ \t]*$", re.MULTILINE)
+
+
+# Emoji joiners, variation selectors and skin tone modifiers
+EMOJI_MODIFIERS = re.compile("[\u200d\ufe0e\ufe0f\U0001f3fb-\U0001f3ff]")
+
+
+# Function to drop emojis and pictographs, which TTS either skips or reads out by name
+def strip_emojis(text):
+    text = EMOJI_MODIFIERS.sub("", text)
+    # Symbols below the arrows block ("°", "©") are kept, they are read correctly
+    return "".join(
+        char for char in text
+        if char < "\u2190" or unicodedata.category(char) not in ("So", "Cs")
+    )
+
+
+# Function to turn a markdown table row into a spoken list of cells
+def speak_table_row(match):
+    cells = [cell.strip() for cell in match.group(0).strip().strip("|").split("|")]
+    return ", ".join(cell for cell in cells if cell) + "."
+
+
+# Function to turn chat markdown into plain text worth speaking
+def normalize_for_speech(text):
+    """
+    Strip what should not be read aloud: images, URLs, code blocks, emojis
+    and markdown syntax. Link labels and table cells are kept as text and
+    numbered list markers become "1:" so they are not read as sentence ends.
+    """
+    text = CODE_FENCE.sub(" ", text)
+    text = IMAGE.sub(" ", text)
+    text = LINK.sub(r"\1", text)
+    text = URL.sub(" ", text)
+    text = TABLE_SEPARATOR.sub("", text)
+    text = re.sub(r"^[ \t]*\|.*\|[ \t]*$", speak_table_row, text, flags=re.MULTILINE)
+    text = RULE.sub("", text)
+    text = HEADING.sub("", text)
+    text = BLOCKQUOTE.sub("", text)
+    text = BULLET.sub("", text)
+    text = NUMBERED.sub(r"\1: ", text)
+    text = text.replace(" & ", " and ")
+    for _ in range(2):
+        text = EMPHASIS.sub(lambda match: match.group(2) or match.group(4), text)
+    text = strip_emojis(text)
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r" *\n[\s]*", "\n", text)
+    return text.strip()
+
+
+# Function to tell whether a boundary candidate really ends a sentence
+def is_sentence_end(text, match):
+    if match.group(0) == "\n":
+        return True
+    if match.group(0)[0] != ".":
+        return True
+    # Only the word before the period is looked at, which keeps the scan linear
+    end = match.start()
+    lo = max(0, end - 32)
+    start = max(lo - 1, text.rfind(" ", lo, end), text.rfind("\n", lo, end), text.rfind("\t", lo, end)) + 1
+    word = text[start:end].lstrip("(\"'")
+    if not word:
+        return True
+    # Abbreviations ("e.g.", "St."), initials ("A.") and initialisms ("U.S.")
+    if word.lower() in ABBREVIATIONS or INITIALS.fullmatch(word):
+        return False
+    # Numbered list markers at the start of a line ("1. Qatamia")
+    if word.isdigit() and (start == 0 or text[start - 1] == "\n"):
+        return False
+    return True
+
+
+# Function to find the end offset of every complete sentence in a text
+def sentence_ends(text):
+    return [match.end() for match in BOUNDARY.finditer(text) if is_sentence_end(text, match)]
+
+
+# Function to split text into sentences, aware of abbreviations, decimals and list markers
+def split_sentences(text):
+    sentences = []
+    start = 0
+    for end in sentence_ends(text):
+        sentence = text[start:end].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = end
+    tail = text[start:].strip()
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+
+# Function to cut the head off an over-long sentence at a comma, then a space, within max_length
+def cut_sentence(sentence, max_length):
+    cut = sentence.rfind(", ", 0, max_length)
+    if cut <= 0:
+        cut = sentence.rfind(" ", 0, max_length)
+    if cut <= 0:
+        cut = max_length - 1
+    return sentence[:cut + 1].strip(), sentence[cut + 1:].strip()
+
+
+# Function to split one over-long sentence at commas, then spaces
+def split_long_sentence(sentence, max_length):
+    pieces = []
+    while len(sentence) > max_length:
+        piece, sentence = cut_sentence(sentence, max_length)
+        pieces.append(piece)
+    if sentence:
+        pieces.append(sentence)
+    return pieces
+
+
+# Function to pack sentences into chunks that start small and grow
+def chunk_sentences(sentences, first_length=None, max_length=None, growth=None):
+    """
+    Pack sentences into TTS chunks in linear time
+
+    The first chunk is kept short so its audio comes back fast; each later
+    chunk may be `growth` times larger, up to max_length, so long answers
+    need fewer requests.
+
+    Args:
+        sentences (list): Sentences in order
+        first_length (int): Character limit of the first chunk
+        max_length (int): Character limit of any chunk
+        growth (float): Factor by which the limit grows per chunk
+
+    Returns:
+        list: Text chunks
+    """
+    max_length = max_length or Config.tts_max_chunk_chars
+    limit = min(first_length or Config.tts_first_chunk_chars, max_length)
+    growth = growth or Config.tts_chunk_growth
+
+    chunks = []
+    parts = []
+    size = 0
+    for sentence in sentences:
+        while sentence:
+            if parts and size + 1 + len(sentence) > limit:
+                chunks.append(" ".join(parts))
+                parts, size = [], 0
+                limit = min(int(limit * growth), max_length)
+            # A sentence longer than the current limit is cut to it, the rest
+            # goes into the next, larger chunks
+            if len(sentence) > limit:
+                piece, sentence = cut_sentence(sentence, limit)
+            else:
+                piece, sentence = sentence, ""
+            parts.append(piece)
+            size += len(piece) + (1 if size else 0)
+    if parts:
+        chunks.append(" ".join(parts))
+    return chunks
@@ -1,24 +1,15 @@
 import streamlit as st
 from streamlit_mic_recorder import mic_recorder
-import io
-import openai
-from openai import OpenAI
+from assistant import transcribe_recording
+from config import Config
 
-# 🔑 Set your OpenAI API key
-
-# Initialize OpenAI client using secrets
-def get_openai_client():
-    try:
-        # Get API key from Streamlit secrets
-        api_key = st.secrets["openai"]["api_key"]
-        return OpenAI(api_key=api_key)
-    except Exception as e:
-        st.error(f"Error initializing OpenAI client: {str(e)}")
-        st.error("Please make sure you've set up your OpenAI API key in Streamlit Secrets.")
-        return None
-
-# Get the client
-client = get_openai_client()
+# Function to keep per-utterance pre-processing stats in the session
+def record_stt_stats(stats):
+    if stats is None:
+        return
+    history = st.session_state.setdefault("stt_stats", [])
+    history.append(stats)
+    del history[:-Config.stt_stats_history]
 
 def record_voice(language="en"):
     """
@@ -33,17 +24,11 @@ def record_voice(language="en"):
     
     if audio is not None:
         try:
-            audio_bytes = audio['bytes']
-            audio_stream = io.BytesIO(audio_bytes)
-            audio_stream.name = "audio.wav"  # Required for OpenAI API
-            
-            response = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_stream,
-                language=language
-            )
-            
-            return response.text.strip()
+            text, stats = transcribe_recording(audio['bytes'], language)
+            record_stt_stats(stats)
+            if text is None:
+                st.warning("No speech detected, please try again.")
+            return text
         except Exception as e:
             st.error(f"Transcription error:\n\n{e}")
             return None